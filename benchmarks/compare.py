@@ -0,0 +1,58 @@
+"""Compare two benchmark result files and report regressions.
+
+    python -m benchmarks.compare baseline.json current.json [--tolerance 0.2]
+
+Exits non-zero if any route got slower (p95 latency up or throughput
+down by more than the tolerance) or started issuing more queries.
+"""
+
+import argparse
+import json
+import sys
+
+
+def find_regressions(baseline, current, tolerance=0.2):
+    """Messages describing every regression of `current` over `baseline`."""
+    regressions = []
+    for route, before in sorted(baseline['results'].items()):
+        after = current['results'].get(route)
+        if after is None:
+            regressions.append('{0}: missing from current run'.format(route))
+            continue
+        if after['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append('{0}: p95 {1}ms -> {2}ms'.format(
+                route, before['p95_ms'], after['p95_ms']))
+        if after['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append('{0}: {1} -> {2} req/s'.format(
+                route, before['rps'], after['rps']))
+        # query counts are deterministic, so any increase counts
+        if after['queries_per_request'] > before['queries_per_request']:
+            regressions.append('{0}: {1} -> {2} queries/request'.format(
+                route, before['queries_per_request'],
+                after['queries_per_request']))
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    regressions = find_regressions(
+        load(args.baseline), load(args.current), args.tolerance)
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        sys.exit(1)
+    print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
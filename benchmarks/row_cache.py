@@ -0,0 +1,97 @@
+"""Dashboard render time with and without cached task rows.
+
+Seeds a throwaway database at each size, then times GET /tasks/ three
+ways: with the row cache off, with it cold (emptied before every
+request) and warm (rows cached, but the page itself retired by a write,
+as happens after any change).  Everything runs with the deployed
+settings: the shared file response cache gunicorn_config.py selects,
+and the default page sizes and row cache threshold.  --all-rows shows
+every task on one page instead, with the row cache sized to fit.
+
+    python -m benchmarks.row_cache [--sizes 1000 10000 50000]
+        [--repeat 5] [--users 50] [--all-rows]
+"""
+
+import os
+
+# what gunicorn_config.py runs with; set before the app is imported
+os.environ.setdefault('CACHE_TYPE', 'file')
+
+import argparse
+import time
+
+from project import cache, create_app, row_cache
+from benchmarks.suite import BENCH_DB, PASSWORD, seed
+
+app = create_app()
+
+
+def timed_get(client, path):
+    started = time.time()
+    response = client.get(path)
+    response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError('GET {0} returned {1}'.format(
+            path, response.status_code))
+    return time.time() - started
+
+
+def measure(client, mode, repeat):
+    """Median seconds for the dashboard in `mode`: off, cold or warm."""
+    app.config['ROW_CACHE_ENABLED'] = mode != 'off'
+    cache.clear()
+    row_cache.clear()
+    if mode == 'warm':
+        timed_get(client, '/tasks/')
+    samples = []
+    for _ in range(repeat):
+        if mode == 'cold':
+            cache.clear()
+            row_cache.clear()
+        else:
+            # a write somewhere retires the cached page, not the rows
+            cache.bump_generation()
+        samples.append(timed_get(client, '/tasks/'))
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--all-rows', action='store_true')
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + BENCH_DB
+    app.config['WTF_CSRF_ENABLED'] = False
+    print('{0:>8} {1:>10} {2:>10} {3:>10} {4:>8}'.format(
+        'rows', 'off ms', 'cold ms', 'warm ms', 'speedup'))
+    try:
+        for size in args.sizes:
+            seed(args.users, size)
+            if args.all_rows:
+                # render cost then scales with the table
+                app.config['OPEN_TASKS_PER_PAGE'] = size
+                app.config['CLOSED_TASKS_PER_PAGE'] = size
+                row_cache.threshold = size
+            client = app.test_client()
+            # not an admin, so the rows mix links and N/A
+            client.post('/', data=dict(name='user1', password=PASSWORD))
+            results = dict(
+                (mode, measure(client, mode, args.repeat))
+                for mode in ('off', 'cold', 'warm')
+            )
+            print('{0:>8} {1:>10.1f} {2:>10.1f} {3:>10.1f} {4:>7.1f}x'.format(
+                size, results['off'] * 1000, results['cold'] * 1000,
+                results['warm'] * 1000, results['off'] / results['warm']))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(BENCH_DB + suffix):
+                os.remove(BENCH_DB + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Task serialization throughput.
+
+Compares the old hand-built dict + pretty-printed json path with the
+shared TaskSerializer, using the stdlib encoder and (if installed) ujson.
+
+    python -m benchmarks.serializers
+"""
+
+from collections import namedtuple
+import datetime
+import json
+import timeit
+
+from project.api.serializers import TaskSerializer, fast_json
+
+SIZES = (10, 1000, 100000)
+
+Row = namedtuple('Row', [
+    'task_id', 'name', 'due_date', 'priority', 'posted_date', 'status',
+    'user_id'
+])
+
+
+def make_rows(count):
+    """Rows shaped like the api's column query results."""
+    today = datetime.date(2016, 10, 22)
+    return [
+        Row(i, 'Task number {0}'.format(i), today, i % 10 + 1, today, 1, 1)
+        for i in range(count)
+    ]
+
+
+def legacy(rows):
+    """What api.tasks() used to do, down to jsonify's indentation."""
+    items = []
+    for result in rows:
+        items.append({
+            'task_id': result.task_id,
+            'task name': result.name,
+            'due date': str(result.due_date),
+            'priority': result.priority,
+            'posted date': str(result.posted_date),
+            'status': result.status,
+            'user id': result.user_id
+        })
+    return json.dumps({'items': items}, indent=2, sort_keys=True)
+
+
+def serializer_stdlib(rows, serializer=TaskSerializer()):
+    """TaskSerializer with compact stdlib json."""
+    return json.dumps(
+        {'items': [serializer.to_dict(row) for row in rows]},
+        separators=(',', ':')
+    )
+
+
+def serializer_fast(rows, serializer=TaskSerializer()):
+    """TaskSerializer with ujson."""
+    return fast_json.dumps(
+        {'items': [serializer.to_dict(row) for row in rows]})
+
+
+def main():
+    encoders = [('legacy', legacy), ('serializer', serializer_stdlib)]
+    if fast_json is not None:
+        encoders.append(('serializer+ujson', serializer_fast))
+
+    print('{0:>8} {1:>18} {2:>14} {3:>10}'.format(
+        'rows', 'encoder', 'rows/sec', 'bytes'))
+    for size in SIZES:
+        rows = make_rows(size)
+        # roughly the same number of rows serialized for every size
+        number = max(1, 200000 // size)
+        for name, encode in encoders:
+            seconds = min(timeit.repeat(
+                lambda: encode(rows), number=number, repeat=3))
+            print('{0:>8} {1:>18} {2:>14,.0f} {3:>10}'.format(
+                size, name, size * number / seconds, len(encode(rows))))
+
+
+if __name__ == '__main__':
+    main()
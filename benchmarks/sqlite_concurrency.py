@@ -0,0 +1,167 @@
+"""Reads while a writer commits, with and without the SQLite profile.
+
+Seeds a throwaway database, then runs one writer process committing
+small batches of tasks as fast as it can alongside several reader
+processes running the dashboard's open tasks query.  Each run is done
+with SQLite's defaults (rollback journal, synchronous=FULL) and again
+with SQLITE_PRAGMAS from _config.py, so the effect of WAL on reader
+latency and on commit throughput shows side by side.
+
+    python -m benchmarks.sqlite_concurrency [--readers 4] [--seconds 5]
+        [--tasks 20000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from project._config import SQLITE_PRAGMAS
+from project.database import apply_pragmas
+
+# what a connection gets without the profile; the busy timeout is kept so
+# readers wait for the writer instead of erroring straight away
+DEFAULT_PRAGMAS = [
+    ('journal_mode', 'DELETE'),
+    ('synchronous', 'FULL'),
+    ('busy_timeout', 5000),
+]
+
+READ_QUERY = (
+    "SELECT task_id, name, due_date, priority FROM tasks "
+    "WHERE status = 1 ORDER BY due_date, task_id LIMIT 25"
+)
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    apply_pragmas(connection, pragmas)
+    return connection
+
+
+def seed(path, tasks):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE tasks (task_id INTEGER PRIMARY KEY, name TEXT, "
+        "due_date DATE, priority INTEGER, status INTEGER)")
+    connection.execute(
+        "CREATE INDEX ix_tasks_status_due_date "
+        "ON tasks (status, due_date, task_id)")
+    connection.executemany(
+        "INSERT INTO tasks (name, due_date, priority, status) "
+        "VALUES (?, date('now', ?), ?, ?)",
+        [('Task {0}'.format(i), '+{0} days'.format(i % 365), i % 10 + 1,
+          i % 2) for i in range(tasks)]
+    )
+    connection.commit()
+    connection.close()
+
+
+def writer(path, pragmas, seconds, results):
+    connection = connect(path, pragmas)
+    commits = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany(
+            "INSERT INTO tasks (name, due_date, priority, status) "
+            "VALUES (?, date('now'), 5, 1)",
+            [('Written task',)] * 20
+        )
+        connection.execute(
+            "UPDATE tasks SET status = 0 WHERE task_id = "
+            "(SELECT max(task_id) FROM tasks)")
+        connection.execute("COMMIT")
+        commits += 1
+    connection.close()
+    results.put(('writer', commits, []))
+
+
+def reader(path, pragmas, seconds, results):
+    connection = connect(path, pragmas)
+    latencies = []
+    errors = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            connection.execute(READ_QUERY).fetchall()
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.time() - started)
+    connection.close()
+    results.put(('reader', errors, latencies))
+
+
+def percentile(ordered, pct):
+    return ordered[max(0, int(round(pct / 100.0 * len(ordered))) - 1)]
+
+
+def measure(path, pragmas, args):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(
+        target=writer, args=(path, pragmas, args.seconds, results))]
+    processes += [
+        multiprocessing.Process(
+            target=reader, args=(path, pragmas, args.seconds, results))
+        for _ in range(args.readers)
+    ]
+    for process in processes:
+        process.start()
+    commits, errors, latencies = 0, 0, []
+    for _ in processes:
+        kind, count, samples = results.get()
+        if kind == 'writer':
+            commits = count
+        else:
+            errors += count
+            latencies.extend(samples)
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        'commits_per_sec': commits / args.seconds,
+        'reads_per_sec': len(latencies) / args.seconds,
+        'read_p50_ms': percentile(latencies, 50) * 1000,
+        'read_p99_ms': percentile(latencies, 99) * 1000,
+        'read_max_ms': latencies[-1] * 1000,
+        'read_errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--tasks', type=int, default=20000)
+    args = parser.parse_args()
+
+    print('1 writer, {0} readers, {1}s per profile'.format(
+        args.readers, args.seconds))
+    print('{0:<10} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>7}'.format(
+        'profile', 'commits/s', 'reads/s', 'p50 ms', 'p99 ms', 'max ms',
+        'errors'))
+    for name, pragmas in (('default', DEFAULT_PRAGMAS),
+                          ('app', SQLITE_PRAGMAS)):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'concurrency.db')
+        try:
+            seed(path, args.tasks)
+            r = measure(path, pragmas, args)
+        finally:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            os.rmdir(directory)
+        print('{0:<10} {1:>10.1f} {2:>10.1f} {3:>10.3f} {4:>10.3f} '
+              '{5:>10.3f} {6:>7}'.format(
+                  name, r['commits_per_sec'], r['reads_per_sec'],
+                  r['read_p50_ms'], r['read_p99_ms'], r['read_max_ms'],
+                  r['read_errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Time from a cold process to its first served request.
+
+Copies the app into a scratch directory and starts fresh Python
+processes there.  Each imports `project`, then wsgi.py (which calls
+create_app() to import the views, and compiles the templates), then
+serves GET / (the login page) and GET /register/ through the test
+client.  Every run is done twice: cold, with no
+module bytecode or compiled templates (a new dyno before this change),
+and after `python build.py` has precompiled both.
+
+    python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in the child: prints import, wsgi.py and first request ms
+CHILD = """
+import time
+started = time.time()
+import project
+imported = time.time()
+from wsgi import app
+compiled = time.time()
+client = app.test_client()
+for path in ('/', '/register/'):
+    assert client.get(path).status_code == 200
+served = time.time()
+print('{0} {1} {2}'.format((imported - started) * 1000,
+                           (compiled - imported) * 1000,
+                           (served - compiled) * 1000))
+"""
+
+
+def clean(directory):
+    """Drop every compiled module and template under `directory`."""
+    for path, dirs, files in os.walk(directory):
+        for name in dirs:
+            if name in ('__pycache__', 'template_cache'):
+                shutil.rmtree(os.path.join(path, name))
+        for name in files:
+            if name.endswith('.pyc'):
+                os.remove(os.path.join(path, name))
+
+
+def start(directory):
+    """(import, wsgi.py, first requests) ms for one new process."""
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD], cwd=directory,
+        env=dict(os.environ, CACHE_TYPE='null'))
+    return [float(ms) for ms in output.decode('ascii').split()]
+
+
+def median(samples):
+    return sorted(samples)[len(samples) // 2]
+
+
+def measure(directory, runs, build):
+    """Median of each of start()'s timings over `runs` processes."""
+    samples = []
+    for _ in range(runs):
+        clean(directory)
+        if build:
+            subprocess.check_call(
+                [sys.executable, 'build.py'], cwd=directory,
+                stdout=open(os.devnull, 'w'))
+        samples.append(start(directory))
+    return [median(timings) for timings in zip(*samples)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(ROOT, 'project'),
+                        os.path.join(directory, 'project'))
+        for name in ('wsgi.py', 'build.py'):
+            shutil.copy(os.path.join(ROOT, name), directory)
+        print('{0:<12} {1:>10} {2:>13} {3:>13} {4:>10}'.format(
+            'start', 'import ms', 'wsgi.py ms', 'first req ms',
+            'total ms'))
+        for name, build in (('cold', False), ('precompiled', True)):
+            timings = measure(directory, args.runs, build)
+            print('{0:<12} {1:>10.1f} {2:>13.1f} {3:>13.1f} {4:>10.1f}'
+                  .format(name, *(timings + [sum(timings)])))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Latency, throughput and query counts for the main routes.
+
+Seeds a throwaway SQLite database, then drives login, the dashboard,
+adding and completing tasks and the task api, first through the Flask
+test client and then through a real local WSGI server.  Results are
+printed and, with --output, saved as json for `fab compare_benchmarks`.
+
+    python -m benchmarks.suite [--users 50] [--tasks 5000]
+        [--requests 200] [--output benchmarks/results/current.json]
+"""
+
+import os
+
+# measure the real work rather than the response cache; this has to be
+# set before the app is imported
+os.environ.setdefault('CACHE_TYPE', 'null')
+
+import argparse
+import datetime
+import json
+import platform
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlencode
+except ImportError:
+    from httplib import HTTPConnection
+    from urllib import urlencode
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from project import bcrypt, create_app, db
+from project.models import Task, User
+from project.tasks.operations import recount_stats
+
+app = create_app()
+BENCH_DB = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'bench.db')
+PASSWORD = 'benchmark'
+
+
+def seed(users, tasks):
+    """Fill a fresh database with `users` users and `tasks` tasks."""
+    db.drop_all()
+    db.create_all()
+    # one hash for everybody; hashing per user would dominate seeding
+    password = bcrypt.generate_password_hash(PASSWORD)
+    db.session.execute(User.__table__.insert(), [
+        dict(name='user{0}'.format(i), email='user{0}@example.com'.format(i),
+             password=password, role='admin' if i == 0 else 'user')
+        for i in range(users)
+    ])
+    today = datetime.date.today()
+    now = datetime.datetime.utcnow()
+    batch = []
+    for i in range(tasks):
+        batch.append(dict(
+            name='Task {0}'.format(i),
+            due_date=today + datetime.timedelta(days=i % 365),
+            priority=i % 10 + 1,
+            posted_date=now,
+            status=i % 2,
+            user_id=i % users + 1
+        ))
+        if len(batch) == 10000:
+            db.session.execute(Task.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Task.__table__.insert(), batch)
+    recount_stats()
+    db.session.commit()
+
+
+class QueryCounter(object):
+    """Counts statements sent to the database."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(db.engine, 'before_cursor_execute', self.callback)
+
+    def callback(self, *args):
+        self.count += 1
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    index = max(0, int(round(pct / 100.0 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, queries):
+    """Percentiles, throughput and queries per request for one route."""
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'rps': round(len(latencies) / elapsed, 2),
+        'queries_per_request': round(queries / float(len(latencies)), 2),
+    }
+
+
+class TestClientDriver(object):
+    """Sends requests through Flask's test client."""
+
+    name = 'client'
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that doesn't log every request to stderr."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServerDriver(object):
+    """Sends requests over HTTP to a WSGI server in a background thread."""
+
+    name = 'server'
+
+    def __init__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, app, threaded=True,
+            request_handler=QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.connection = HTTPConnection(
+            '127.0.0.1', self.server.server_port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+
+
+def scenarios(requests, tasks):
+    """(name, request count, function(i) -> (method, path, data))."""
+    login = dict(name='user0', password=PASSWORD)
+    new_task = dict(name='Benchmark task', due_date='02/05/2030',
+                    priority='5')
+    return [
+        # bcrypt makes logins slow on purpose, so fewer of them
+        ('login', max(5, requests // 20),
+         lambda i: ('POST', '/', login)),
+        ('tasks', requests, lambda i: ('GET', '/tasks/', None)),
+        ('add', requests, lambda i: ('POST', '/add/', new_task)),
+        # every other seeded task is open; user0 is an admin
+        ('complete', requests,
+         lambda i: ('GET', '/complete/{0}/'.format(
+             (2 * i) % tasks + 2), None)),
+        ('api_tasks', requests,
+         lambda i: ('GET', '/api/v1/tasks/?limit=50', None)),
+    ]
+
+
+def run(driver, requests, tasks):
+    """Run every scenario through `driver`, keyed '<driver>:<route>'."""
+    counter = QueryCounter()
+    results = {}
+    # every scenario after login runs logged in as the admin
+    for name, count, make_request in scenarios(requests, tasks):
+        latencies = []
+        queries = counter.count
+        started = time.time()
+        for i in range(count):
+            method, path, data = make_request(i)
+            begin = time.time()
+            status = driver.request(method, path, data)
+            latencies.append(time.time() - begin)
+            if status >= 400:
+                raise RuntimeError('{0} {1} returned {2}'.format(
+                    method, path, status))
+        elapsed = time.time() - started
+        results['{0}:{1}'.format(driver.name, name)] = summarize(
+            latencies, elapsed, counter.count - queries)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + BENCH_DB
+    app.config['WTF_CSRF_ENABLED'] = False
+    results = {}
+    for driver_class in (TestClientDriver, ServerDriver):
+        seed(args.users, args.tasks)
+        driver = driver_class()
+        try:
+            results.update(run(driver, args.requests, args.tasks))
+        finally:
+            driver.close()
+    os.remove(BENCH_DB)
+
+    print('{0:<20} {1:>9} {2:>9} {3:>9} {4:>9} {5:>8}'.format(
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries'))
+    for name in sorted(results):
+        r = results[name]
+        print('{0:<20} {1:>9} {2:>9} {3:>9} {4:>9} {5:>8}'.format(
+            name, r['p50_ms'], r['p95_ms'], r['p99_ms'], r['rps'],
+            r['queries_per_request']))
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'users': args.users,
+                    'tasks': args.tasks,
+                    'requests': args.requests,
+                    'python': platform.python_version(),
+                    'time': datetime.datetime.utcnow().isoformat() + 'Z',
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
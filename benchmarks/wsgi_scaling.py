@@ -0,0 +1,133 @@
+"""Requests/sec through gunicorn as the worker count grows.
+
+Starts gunicorn with gunicorn_config.py at each worker count in turn,
+drives it from several client threads over keep-alive connections and
+prints the throughput, so the scaling across cores can be checked on the
+box the app will actually run on.
+
+    python -m benchmarks.wsgi_scaling [--path /api/v1/tasks/]
+        [--workers 1,2,4] [--clients 16] [--seconds 10]
+        [--worker-class gthread]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN = 'from gunicorn.app.wsgiapp import run; run()'
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_until_up(server, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline and server.poll() is None:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn did not start on port {0}'.format(port))
+
+
+def hammer(port, path, seconds, counts, errors):
+    """Send requests on one keep-alive connection until time is up."""
+    connection = HTTPConnection('127.0.0.1', port, timeout=10)
+    done = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors.append(response.status)
+        except (socket.error, IOError) as e:
+            errors.append(str(e))
+            connection.close()
+            connection = HTTPConnection('127.0.0.1', port, timeout=10)
+    counts.append(done)
+
+
+def measure(workers, args):
+    port = free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        # measure the real work, not the response cache
+        CACHE_TYPE='null'
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-c', GUNICORN, '-c', 'gunicorn_config.py',
+         '--bind', '127.0.0.1:{0}'.format(port), 'wsgi:app'],
+        cwd=ROOT, env=env
+    )
+    try:
+        wait_until_up(server, port)
+        counts, errors = [], []
+        clients = [
+            threading.Thread(
+                target=hammer,
+                args=(port, args.path, args.seconds, counts, errors))
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return sum(counts) / float(args.seconds), len(errors)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='/api/v1/tasks/')
+    parser.add_argument('--workers', default=None,
+                        help='comma separated worker counts')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--worker-class', default='gthread')
+    args = parser.parse_args()
+
+    cores = multiprocessing.cpu_count()
+    if args.workers:
+        worker_counts = [int(n) for n in args.workers.split(',')]
+    else:
+        worker_counts = sorted(set([1, 2, cores, cores * 2 + 1]))
+
+    print('{0} cores, {1} clients, {2} workers, GET {3}'.format(
+        cores, args.clients, args.worker_class, args.path))
+    print('{0:>8} {1:>12} {2:>8}'.format('workers', 'req/sec', 'errors'))
+    baseline = None
+    for workers in worker_counts:
+        rate, errors = measure(workers, args)
+        baseline = baseline or rate
+        print('{0:>8} {1:>12.1f} {2:>8}   x{3:.2f}'.format(
+            workers, rate, errors, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
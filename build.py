@@ -0,0 +1,20 @@
+"""Compiles the app ahead of time, so new workers and dynos start faster.
+
+Writes bytecode for every module under project/ (a fresh dyno otherwise
+compiles them on each boot) and fills TEMPLATE_CACHE_DIR with compiled
+templates.  Heroku runs it from bin/post_compile on every deploy.
+
+    python build.py
+"""
+
+import compileall
+
+from project import app
+from project._config import basedir
+from project.templating import precompile_templates
+
+if __name__ == '__main__':
+    compileall.compile_dir(basedir, quiet=1)
+    names = precompile_templates(app)
+    print('Compiled {0} templates into {1}'.format(
+        len(names), app.config['TEMPLATE_CACHE_DIR']))
@@ -0,0 +1,18 @@
+"""Compact the task change log behind /api/v1/tasks/changes.
+
+Drops every entry superseded by a later change to the same task, plus
+delete tombstones older than CHANGES_TOMBSTONE_DAYS.  Safe to run at any
+time, e.g. daily from cron.
+"""
+
+import datetime
+
+from project import app, cache, db
+from project.tasks.operations import compact_changes
+
+
+removed = compact_changes(
+    datetime.timedelta(days=app.config['CHANGES_TOMBSTONE_DAYS']))
+db.session.commit()
+cache.bump_generation()
+print("Removed {0} task changes.".format(removed))
@@ -0,0 +1,14 @@
+"""Recount the task_stats counters from the tasks table.
+
+The task views and api keep the counters up to date themselves; run this
+after loading or editing tasks behind the app's back, or if the counts
+ever look wrong.  It rewrites every counter in a single transaction.
+"""
+
+from project import db
+from project.tasks.operations import recount_stats
+
+
+rows = recount_stats()
+db.session.commit()
+print("Recounted task stats for {0} rows.".format(rows))
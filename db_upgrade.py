@@ -0,0 +1,107 @@
+"""Bring an existing database up to the current schema.
+
+Every step is idempotent, so this is safe to run against a live database
+on each deploy.
+"""
+
+import sqlite3
+
+from project._config import DATABASE_PATH
+from project.search import CREATE_FTS, DROP_FTS, REBUILD_FTS, has_fts5
+
+
+with sqlite3.connect(DATABASE_PATH) as connection:
+    c = connection.cursor()
+
+    # Indexes for the dashboard lists and ownership checks.  SQLite builds
+    # an index in a single pass without rewriting the table, and readers
+    # carry on against the old snapshot while it does.
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS ix_tasks_status_due_date
+        ON tasks (status, due_date, task_id)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS ix_tasks_user_id_status
+        ON tasks (user_id, status)"""
+    )
+
+    # Per-task version used for api ETags.  Existing rows start at
+    # revision 1, last modified when they were posted.
+    columns = [row[1] for row in c.execute("""PRAGMA table_info(tasks)""")]
+    if 'revision' not in columns:
+        c.execute(
+            """ALTER TABLE tasks
+            ADD COLUMN revision INTEGER NOT NULL DEFAULT 1"""
+        )
+    if 'updated_at' not in columns:
+        c.execute("""ALTER TABLE tasks ADD COLUMN updated_at DATETIME""")
+        c.execute("""UPDATE tasks SET updated_at = posted_date""")
+
+    # Open/closed counters per user, plus user_id 0 for the totals.  They
+    # are filled in once here; the app keeps them current from then on.
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS task_stats (
+        user_id INTEGER NOT NULL PRIMARY KEY,
+        open_count INTEGER NOT NULL,
+        closed_count INTEGER NOT NULL)"""
+    )
+    if c.execute("""SELECT count(*) FROM task_stats""").fetchone()[0] == 0:
+        c.execute(
+            """INSERT INTO task_stats (user_id, open_count, closed_count)
+            SELECT user_id, count(CASE WHEN status = 1 THEN 1 END),
+                   count(CASE WHEN status = 0 THEN 1 END)
+            FROM tasks WHERE user_id IS NOT NULL GROUP BY user_id"""
+        )
+        c.execute(
+            """INSERT INTO task_stats (user_id, open_count, closed_count)
+            SELECT 0, count(CASE WHEN status = 1 THEN 1 END),
+                   count(CASE WHEN status = 0 THEN 1 END)
+            FROM tasks"""
+        )
+
+    # Change log for incremental api sync.  AUTOINCREMENT keeps seq from
+    # ever being reused, even once compaction has removed the last entry.
+    # A new log starts with every existing task, so syncing from 0 gets
+    # the lot.
+    exists = c.execute(
+        """SELECT 1 FROM sqlite_master WHERE name = 'task_changes'"""
+    ).fetchone()
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS task_changes (
+        seq INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER NOT NULL,
+        op VARCHAR NOT NULL,
+        changed_at DATETIME NOT NULL)"""
+    )
+    if not exists:
+        c.execute(
+            """INSERT INTO task_changes (task_id, op, changed_at)
+            SELECT task_id, 'create', datetime('now') FROM tasks
+            ORDER BY task_id"""
+        )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS task_changes_horizon (
+        id INTEGER NOT NULL PRIMARY KEY,
+        seq INTEGER NOT NULL)"""
+    )
+
+    # Full-text index over task names, kept current by triggers.  Only a
+    # newly created index needs filling from the existing rows.  Without
+    # FTS5 in this SQLite, search falls back to scanning names.
+    if has_fts5():
+        exists = c.execute(
+            """SELECT sql FROM sqlite_master WHERE name = 'tasks_fts'"""
+        ).fetchone()
+        if exists and "prefix='2 3'" in exists[0]:
+            # first built with a 2 letter prefix index no query uses
+            for statement in DROP_FTS:
+                c.execute(statement)
+            exists = None
+        for statement in CREATE_FTS:
+            c.execute(statement)
+        if not exists:
+            c.execute(REBUILD_FTS)
+
+    # refresh the planner statistics so the new indexes actually get used
+    c.execute("""ANALYZE tasks""")
+    c.execute("""ANALYZE task_stats""")
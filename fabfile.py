@@ -9,6 +9,38 @@ def test():
         abort("Aborted at user request.")
 
 
+def repair_stats():
+    local("python db_repair_stats.py")
+
+
+def compact_changes():
+    local("python db_compact_changes.py")
+
+
+def build():
+    local("python build.py")
+
+
+def benchmark(name='current', users=50, tasks=5000, requests=200):
+    local(
+        "python -m benchmarks.suite --users {0} --tasks {1} --requests {2} "
+        "--output benchmarks/results/{3}.json".format(
+            users, tasks, requests, name)
+    )
+
+
+def compare_benchmarks(baseline='baseline', current='current',
+                       tolerance=0.2):
+    with settings(warn_only=True):
+        result = local(
+            "python -m benchmarks.compare benchmarks/results/{0}.json "
+            "benchmarks/results/{1}.json --tolerance {2}".format(
+                baseline, current, tolerance)
+        )
+    if result.failed:
+        abort("Performance regressed against {0}.".format(baseline))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -0,0 +1,63 @@
+"""Gunicorn settings for serving the app.
+
+    gunicorn -c gunicorn_config.py wsgi:app
+
+Every setting can be overridden from the environment so a dyno or host
+can be tuned without a code change.  `kill -HUP <master>` gracefully
+replaces the workers; because the app is preloaded, picking up new code
+needs a binary upgrade (`kill -USR2` then `kill -WINCH` on the old
+master) or a full restart.
+"""
+
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{0}'.format(os.environ.get('PORT', 5000))
+
+# 'gthread' serves several requests per process on threads, 'sync' one at
+# a time; 'gevent' needs gevent installed and suits long-lived streams
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+
+# recycle workers now and then so slow leaks can't build up
+max_requests = 1000
+max_requests_jitter = 100
+
+# import the app once in the master so workers share its memory
+# copy-on-write instead of each importing it again
+preload_app = True
+
+# with several workers the response cache and the live dashboard events
+# have to be shared between them
+os.environ.setdefault('CACHE_TYPE', 'file')
+os.environ.setdefault('EVENTS_BROKER', 'changelog')
+
+# on Heroku every request arrives through the router, so the client's
+# address is the one it appends to X-Forwarded-For
+if 'DYNO' in os.environ:
+    os.environ.setdefault('TRUSTED_PROXIES', '1')
+
+# an event stream holds its thread for minutes; under gthread leave at
+# least half of each worker's threads for ordinary requests (gevent
+# streams only cost a greenlet, and sync workers refuse streams).
+# Likewise a login burst mustn't park every thread in bcrypt: hashing
+# plus waiting for a hashing slot always leaves one thread free.
+if worker_class == 'gthread':
+    os.environ.setdefault('EVENTS_MAX_CONNECTIONS', str(max(1, threads // 2)))
+    hash_workers = int(os.environ.setdefault(
+        'PASSWORD_HASH_WORKERS', str(max(1, min(2, threads - 1)))))
+    os.environ.setdefault(
+        'PASSWORD_HASH_MAX_WAITING', str(max(0, threads - hash_workers - 1)))
+
+
+def post_fork(server, worker):
+    # never share database connections opened before the fork
+    from project import db
+    db.engine.dispose()
@@ -1,37 +1,94 @@
 """Where the main app is set up."""
 
-from flask import Flask, render_template, request
-from flask.ext.sqlalchemy import SQLAlchemy
+from flask import Flask, g, render_template, request
 from flask.ext.bcrypt import Bcrypt
-import datetime
+from werkzeug.contrib.fixers import ProxyFix
+import time
+
+from project.cache import make_cache, make_row_cache
+from project.database import Database
+from project.errorlog import make_error_log
+from project.events import make_broker
+from project.hashing import make_hasher
+from project.ratelimit import make_login_throttle
+from project.templating import make_bytecode_cache
 
 app = Flask(__name__)
 app.config.from_pyfile('_config.py')
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app, num_proxies=app.config['TRUSTED_PROXIES'])
+# has to be set before anything touches app.jinja_env, which is built
+# from jinja_options on first use
+app.jinja_options = dict(
+    app.jinja_options, bytecode_cache=make_bytecode_cache(app.config))
 bcrypt = Bcrypt(app)
-db = SQLAlchemy(app)
+hasher = make_hasher(app.config, bcrypt)
+db = Database(app)
+cache = make_cache(app.config)
+row_cache = make_row_cache(app.config)
+error_log = make_error_log(app.config)
+events = make_broker(app.config, db)
+login_throttle = make_login_throttle(app.config, cache)
+
+
+def create_app():
+    """Finish `app`: register its blueprints and its instrumentation.
+
+    Importing `project` only builds the app object and its extensions,
+    which is all the db scripts and gunicorn_config.py need.  The views,
+    and the forms, serializers and search code they pull in, are only
+    imported here, so anything that serves requests (wsgi.py, run.py,
+    the tests, the benchmarks) calls this first.  The instrumentation
+    ends up in app.extensions['instrumentation'].  Calling it again just
+    returns the app.
+    """
+    if 'tasks' in app.blueprints:
+        return app
+
+    from project.instrumentation import Instrumentation
+    from project.users.views import users_blueprint
+    from project.tasks.views import tasks_blueprint
+    from project.api.views import api_blueprint
 
-from project.users.views import users_blueprint
-from project.tasks.views import tasks_blueprint
-from project.api.views import api_blueprint
+    # register blueprints
 
-# register blueprints
+    app.register_blueprint(users_blueprint)
+    app.register_blueprint(tasks_blueprint)
+    app.register_blueprint(api_blueprint)
 
-app.register_blueprint(users_blueprint)
-app.register_blueprint(tasks_blueprint)
-app.register_blueprint(api_blueprint)
+    instrumentation = Instrumentation(app, bcrypt)
+    app.extensions['instrumentation'] = instrumentation
+    if app.config['INSTRUMENTATION_ENABLED']:
+        instrumentation.install()
+    return app
 
 
 # Error Handling
 
 
+@app.before_request
+def start_timer():
+    g.request_started = time.time()
+
+
+def log_error(status):
+    """Hand the current request's error to the background error log."""
+    started = getattr(g, 'request_started', None)
+    error_log.log(
+        status,
+        request.url,
+        method=request.method,
+        route=request.url_rule.rule if request.url_rule else None,
+        duration_ms=round((time.time() - started) * 1000, 2)
+        if started else None
+    )
+
+
 @app.errorhandler(404)
 def not_found(error):
     if app.debug is not True:
-        now = datetime.datetime.now()
-        r = request.url
-        with open('error.log', 'a') as f:
-            current_timestamp = now.strftime("%d-%m-%Y %H:%M:%S")
-            f.write("\n404 error at {}:{}".format(current_timestamp, r))
+        log_error(404)
     return render_template('404.html'), 404
 
 
@@ -39,9 +96,6 @@ def not_found(error):
 def internal_error(error):
     db.session.rollback()
     if app.debug is not True:
-        now = datetime.datetime.now()
-        r = request.url
-        with open('error.log', 'a') as f:
-            current_timestamp = now.strftime("%d-%m-%Y %H:%M:%S")
-            f.write("\n500 error at {}:{}".format(current_timestamp, r))
+        log_error(500)
     return render_template('500.html'), 500
+
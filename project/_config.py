@@ -12,4 +12,130 @@ DATABASE_PATH = os.path.join(basedir, DATABASE)
 # the database uri
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DATABASE_PATH
 
+# optional database for reads that may lag slightly behind the primary
+# (dashboard lists, api reads, exports); unset sends them to the primary
+SQLALCHEMY_READ_DATABASE_URI = os.environ.get('READ_DATABASE_URL')
+# after a commit, that user's reads go to the primary for this many
+# seconds so they always see their own changes
+READ_AFTER_WRITE_SECONDS = 10
+
+# run on every new SQLite connection: WAL lets readers carry on while a
+# writer commits, synchronous=NORMAL is still crash-safe under WAL but
+# skips an fsync per commit, busy_timeout (ms) waits for a lock instead of
+# failing, negative cache_size is in KiB
+SQLITE_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),
+    ('mmap_size', 128 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+]
+
+# keep connections (and their page cache) open between requests instead
+# of reconnecting for every session; size it to the threads per worker
+SQLALCHEMY_POOL_SIZE = 5
+SQLALCHEMY_MAX_OVERFLOW = 10
+SQLALCHEMY_POOL_TIMEOUT = 10
+
+# bcrypt work factor for new password hashes; stored hashes made with a
+# different cost are rehashed on the user's next successful login
+BCRYPT_LOG_ROUNDS = 12
+# at most PASSWORD_HASH_WORKERS hashes run at once per process and up to
+# PASSWORD_HASH_MAX_WAITING more wait for a turn; past that, logins and
+# registrations get a 503 instead of tying up every worker
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_WAITING = int(
+    os.environ.get('PASSWORD_HASH_MAX_WAITING', 8))
+
+# failed logins allowed per LOGIN_THROTTLE_WINDOW seconds from one address
+# and against one username; past either limit login posts get a 429
+# without touching the database or bcrypt
+LOGIN_THROTTLE_IP_LIMIT = 20
+LOGIN_THROTTLE_USER_LIMIT = 5
+LOGIN_THROTTLE_WINDOW = 300
+# count in the response cache instead of per process, so every worker
+# sees the same counts (use with CACHE_TYPE = 'file')
+LOGIN_THROTTLE_SHARED = False
+# how many proxies (Heroku's router, a load balancer) sit in front of the
+# app; client addresses, and so the per-address throttle, are then read
+# from X-Forwarded-For.  Leave at 0 when clients connect directly, or
+# they could pick their own address
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+# response cache: 'lru' keeps entries in each worker process, 'file'
+# shares them (and their invalidation) between workers via CACHE_DIR,
+# 'null' turns caching off
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+CACHE_DIR = os.path.join(basedir, 'cache')
+CACHE_THRESHOLD = 500
+CACHE_DEFAULT_TIMEOUT = 300
+
+# rendered dashboard rows are cached by task revision, so they survive the
+# writes that retire whole pages; they're kept in each worker, apart from
+# the response cache.  False renders every row every time
+ROW_CACHE_ENABLED = True
+ROW_CACHE_THRESHOLD = 5000
+ROW_CACHE_TIMEOUT = 3600
+
+# compiled templates are kept here and shared by every worker (fill it
+# ahead of time with `python build.py`); None compiles in each process
+TEMPLATE_CACHE_DIR = os.path.join(basedir, 'template_cache')
+
+# how many rows of each task list the dashboard shows at once
+OPEN_TASKS_PER_PAGE = 25
+CLOSED_TASKS_PER_PAGE = 25
+
+# task search results per dashboard page, and the deepest page served
+SEARCH_PER_PAGE = 25
+SEARCH_MAX_PAGES = 40
+
+# page sizes for GET /api/v1/tasks/
+API_DEFAULT_LIMIT = 10
+API_MAX_LIMIT = 100
+
+# most operations accepted by POST /api/v1/tasks/batch
+API_MAX_BATCH = 500
+
+# db_compact_changes.py drops delete tombstones older than this from the
+# change log; clients that haven't synced for longer must reload
+CHANGES_TOMBSTONE_DAYS = 30
+
+# rows fetched from the database per batch by the task export
+EXPORT_BATCH_SIZE = 1000
+
+# live dashboard updates over server-sent events at /tasks/stream:
+# 'local' reaches streams in the process that made the change,
+# 'changelog' polls the task_changes table so every worker sees all
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'local')
+EVENTS_POLL_INTERVAL = 1.0
+# every open stream holds a thread (or greenlet) of its worker, so cap
+# them per process and end each after a while; browsers reconnect
+EVENTS_MAX_CONNECTIONS = int(os.environ.get('EVENTS_MAX_CONNECTIONS', 50))
+EVENTS_MAX_SECONDS = 300
+# seconds between keep-alive comments on an idle stream
+EVENTS_HEARTBEAT = 15
+
+# error log, written in batches by a background thread; ERROR_LOG_JSON
+# switches to one json object per line with route and timing
+ERROR_LOG_PATH = 'error.log'
+ERROR_LOG_MAX_BYTES = 10 * 1024 * 1024
+ERROR_LOG_BACKUP_COUNT = 5
+ERROR_LOG_JSON = False
+# log at most ERROR_LOG_SAMPLE_LIMIT repeats of one error per window
+ERROR_LOG_SAMPLE_WINDOW = 60
+ERROR_LOG_SAMPLE_LIMIT = 10
+
+# per-request timing of sql, templates and bcrypt (Server-Timing header,
+# per-route stats at INSTRUMENTATION_PATH for admins); off by default
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+INSTRUMENTATION_PATH = '/_stats'
+# how many recent requests per route the stats are computed over
+INSTRUMENTATION_WINDOW = 1000
+# slowest statements kept per request for the slow request log
+INSTRUMENTATION_SLOWEST_QUERIES = 3
+# requests taking at least this many ms go to the slow request log
+INSTRUMENTATION_SLOW_MS = 500
+INSTRUMENTATION_SLOW_LOG_PATH = 'slow_requests.log'
+
 DEBUG = False
@@ -0,0 +1,80 @@
+"""Task serialization shared by the api views and exports."""
+
+from collections import OrderedDict
+import json
+
+from flask import Response
+
+from project import db
+from project.models import Task
+
+try:
+    import ujson as fast_json
+except ImportError:
+    fast_json = None
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+
+def _plain(value):
+    return value
+
+
+# fields a client can ask for: (json key, column, value converter)
+TASK_FIELDS = OrderedDict([
+    ('task_id', ('task_id', Task.task_id, _plain)),
+    ('name', ('task name', Task.name, _plain)),
+    ('due_date', ('due date', Task.due_date, _date)),
+    ('priority', ('priority', Task.priority, _plain)),
+    ('posted_date', ('posted date', Task.posted_date, _date)),
+    ('status', ('status', Task.status, _plain)),
+    ('user_id', ('user id', Task.user_id, _plain)),
+])
+
+
+class TaskSerializer(object):
+    """Turns rows of task columns into their api representation.
+
+    Only the chosen fields are selected, and rows are plain tuples rather
+    than Task objects, so nothing is loaded that isn't sent.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or TASK_FIELDS)
+        specs = [TASK_FIELDS[name] for name in self.fields]
+        self.keys = [key for key, _, _ in specs]
+        self.columns = [column for _, column, _ in specs]
+        self._converters = [convert for _, _, convert in specs]
+
+    def query(self, *extra_columns):
+        """Read query for the serialized columns, then any `extra_columns`."""
+        return db.reader().query(*(self.columns + list(extra_columns)))
+
+    def values(self, row):
+        """Converted values of the serialized columns of `row`, in order."""
+        return [
+            convert(value)
+            for convert, value in zip(self._converters, row)
+        ]
+
+    def to_dict(self, row):
+        """Api dict for a row whose first columns are self.columns."""
+        return dict(zip(self.keys, self.values(row)))
+
+    def from_task(self, task):
+        """Api dict for a Task object."""
+        return self.to_dict([getattr(task, name) for name in self.fields])
+
+
+def dumps(obj):
+    """Compact json, using ujson when it is installed."""
+    if fast_json is not None:
+        return fast_json.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def json_response(obj, status=200):
+    """Json response without jsonify's pretty printing."""
+    return Response(dumps(obj), status=status, mimetype='application/json')
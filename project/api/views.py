@@ -2,18 +2,37 @@
 
 
 from functools import wraps
+import csv
+import datetime
+
 from flask import (
     redirect,
     flash,
-    jsonify,
+    request,
     session,
     url_for,
     Blueprint,
-    make_response
+    Response,
+    stream_with_context
 )
 
-from project import db
-from project.models import Task
+from sqlalchemy import func
+
+from project import app, cache, db, events
+from project.cache import cached_view
+from project.events import task_event
+from project.models import Task, TaskChange
+from project.search import match_query, search_page
+from .serializers import TASK_FIELDS, TaskSerializer, dumps, json_response
+from project.tasks.operations import (
+    change_horizon,
+    check_ownership,
+    complete_tasks,
+    create_tasks,
+    delete_tasks,
+    task_counts,
+    unique_rows,
+)
 
 api_blueprint = Blueprint('api', __name__)
 
@@ -32,42 +51,386 @@ def login_required(test):
     return wrap
 
 
+def int_arg(name, minimum=None, maximum=None):
+    """Read an optional integer query argument, checking its range."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError("{0} must be an integer".format(name))
+    if (minimum is not None and value < minimum) or \
+            (maximum is not None and value > maximum):
+        raise ValueError("{0} is out of range".format(name))
+    return value
+
+
+def date_arg(name):
+    """Read an optional YYYY-MM-DD query argument."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("{0} must be a YYYY-MM-DD date".format(name))
+
+
+def requested_fields():
+    """Names of the fields asked for with ?fields=, defaulting to all."""
+    fields = request.args.get('fields')
+    if not fields:
+        return list(TASK_FIELDS)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TASK_FIELDS]
+    if unknown or not names:
+        raise ValueError("unknown fields: {0}".format(', '.join(unknown)))
+    return names
+
+
+def filter_tasks(query):
+    """Apply the status/user/priority/due date filters in request.args."""
+    for name, column in (
+            ('status', Task.status),
+            ('user_id', Task.user_id),
+            ('priority', Task.priority)):
+        value = int_arg(name)
+        if value is not None:
+            query = query.filter(column == value)
+    due_from = date_arg('due_from')
+    if due_from is not None:
+        query = query.filter(Task.due_date >= due_from)
+    due_to = date_arg('due_to')
+    if due_to is not None:
+        query = query.filter(Task.due_date <= due_to)
+    return query
+
+
+class Echo(object):
+    """File-like object that hands back whatever csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows, serializer):
+    """Yield one compact json document per row."""
+    for row in rows:
+        yield dumps(serializer.to_dict(row)) + '\n'
+
+
+def csv_lines(rows, serializer):
+    """Yield a header line then one csv line per row."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(serializer.fields)
+    for row in rows:
+        yield writer.writerow(serializer.values(row))
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+
+def parse_new_task(operation):
+    """Validate the fields of a batch 'create' operation."""
+    name = operation.get('name')
+    if not name or not hasattr(name, 'strip') or not name.strip():
+        raise ValueError("name is required")
+    try:
+        due_date = datetime.datetime.strptime(
+            operation.get('due_date') or '', '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError("due_date must be a YYYY-MM-DD date")
+    priority = operation.get('priority')
+    if isinstance(priority, bool) or not isinstance(priority, int) or \
+            not 1 <= priority <= 10:
+        raise ValueError("priority must be an integer from 1 to 10")
+    return dict(name=name, due_date=due_date, priority=priority)
+
+
+def parse_task_id(operation):
+    """Validate the task_id of a batch 'complete' or 'delete' operation."""
+    task_id = operation.get('task_id')
+    if isinstance(task_id, bool) or not isinstance(task_id, int):
+        raise ValueError("task_id must be an integer")
+    return task_id
+
+
+def task_etag(task_id, version):
+    """ETag for one revision of a task.
+
+    SQLite hands a deleted task's id to the next one added, which starts
+    over at revision 1, so updated_at (to the microsecond) goes in too.
+    """
+    return '{0}-{1}-{2}'.format(
+        task_id, version.revision,
+        version.updated_at.strftime('%Y%m%d%H%M%S%f')
+        if version.updated_at is not None else '')
+
+
+def not_modified(task_id, version):
+    """True if the client's cached copy of the task is still current."""
+    if request.if_none_match:
+        return request.if_none_match.contains(task_etag(task_id, version))
+    # http dates only carry whole seconds
+    return version.updated_at is not None and \
+        version.updated_at.replace(microsecond=0) <= \
+        request.if_modified_since
+
+
+def versioned(response, task_id, version):
+    """Stamp a task response with its ETag and Last-Modified headers."""
+    response.set_etag(task_etag(task_id, version))
+    if version.updated_at is not None:
+        response.last_modified = version.updated_at
+    return response
+
+
+def bad_request(message):
+    """Json 400 response."""
+    return json_response({'error': message}, 400)
+
+
 # Methods
 
 
 @api_blueprint.route('/api/v1/tasks/')
+@cached_view(cache)
 def tasks():
-    db_results = db.session.query(Task).limit(10).offset(0).all()
-    json_results = []
-    for result in db_results:
-        data = {
-            'task_id': result.task_id,
-            'task name': result.name,
-            'due date': str(result.due_date),
-            'priority': result.priority,
-            'posted date': str(result.posted_date),
-            'status': result.status,
-            'user id': result.user_id
-        }
-        json_results.append(data)
-    return jsonify(items=json_results)
+    try:
+        serializer = TaskSerializer(requested_fields())
+        limit = int_arg('limit', 1, app.config['API_MAX_LIMIT']) \
+            or app.config['API_DEFAULT_LIMIT']
+        after = int_arg('after')
+        # task_id goes on the end of every row to build the cursor from
+        query = filter_tasks(serializer.query(Task.task_id))
+    except ValueError as e:
+        return bad_request(str(e))
+
+    if after is not None:
+        query = query.filter(Task.task_id > after)
+    rows = query.order_by(Task.task_id.asc()).limit(limit + 1).all()
+
+    json_results = [serializer.to_dict(row) for row in rows[:limit]]
+    response = {'items': json_results}
+    if len(rows) > limit:
+        args = request.args.to_dict()
+        args['after'] = rows[limit - 1][-1]
+        response['next'] = url_for('api.tasks', **args)
+    return json_response(response)
+
+
+@api_blueprint.route('/api/v1/tasks/search')
+@cached_view(cache)
+def search_tasks():
+    """Tasks whose names match ?q= (every word as a prefix), best first."""
+    text = request.args.get('q', '')
+    if not match_query(text):
+        return bad_request("q must contain at least one word")
+    try:
+        serializer = TaskSerializer(requested_fields())
+        limit = int_arg('limit', 1, app.config['API_MAX_LIMIT']) \
+            or app.config['API_DEFAULT_LIMIT']
+        page = int_arg('page', 1, app.config['SEARCH_MAX_PAGES']) or 1
+        query = filter_tasks(serializer.query())
+    except ValueError as e:
+        return bad_request(str(e))
+
+    rows, has_next = search_page(query, text, page, limit)
+    response = {'items': [serializer.to_dict(row) for row in rows]}
+    if has_next and page < app.config['SEARCH_MAX_PAGES']:
+        args = request.args.to_dict()
+        args['page'] = page + 1
+        response['next'] = url_for('api.search_tasks', **args)
+    return json_response(response)
+
+
+@api_blueprint.route('/api/v1/tasks/changes')
+@cached_view(cache)
+def task_changes():
+    """Tasks changed after ?since=<seq>, in the order they last changed.
+
+    Each task appears once, as its current state or as a tombstone if it
+    was deleted.  Poll again with the returned 'since'.  A 410 means the
+    log has been compacted past the cursor: reload /api/v1/tasks/ and
+    carry on from the 'since' in the 410, fetched before reloading.
+    """
+    try:
+        since = int_arg('since', 0)
+        if since is None:
+            raise ValueError("since is required; use 0 to start")
+        limit = int_arg('limit', 1, app.config['API_MAX_LIMIT']) \
+            or app.config['API_DEFAULT_LIMIT']
+        serializer = TaskSerializer(requested_fields())
+    except ValueError as e:
+        return bad_request(str(e))
+
+    horizon = change_horizon()
+    if since < horizon:
+        latest = db.reader().query(func.max(TaskChange.seq)).scalar()
+        return json_response({
+            'error': "changes before this cursor have been compacted",
+            'since': max(latest or 0, horizon)
+        }, 410)
+
+    # only the latest change per task, so a busy task is sent once
+    changed = db.reader().query(
+        TaskChange.task_id, func.max(TaskChange.seq).label('seq')
+    ).filter(TaskChange.seq > since) \
+        .group_by(TaskChange.task_id).subquery()
+    rows = serializer.query(
+        changed.c.seq.label('change_seq'),
+        changed.c.task_id.label('change_task_id'),
+        Task.task_id.label('live_task_id')
+    ).select_from(changed) \
+        .outerjoin(Task, Task.task_id == changed.c.task_id) \
+        .order_by(changed.c.seq).limit(limit + 1).all()
+
+    changes = []
+    for row in rows[:limit]:
+        if row.live_task_id is None:
+            changes.append({'seq': row.change_seq, 'op': 'delete',
+                            'task_id': row.change_task_id})
+        else:
+            changes.append({'seq': row.change_seq, 'op': 'upsert',
+                            'task': serializer.to_dict(row)})
+    return json_response({
+        'changes': changes,
+        'since': changes[-1]['seq'] if changes else since,
+        'more': len(rows) > limit
+    })
 
 
 @api_blueprint.route('/api/v1/tasks/<int:id>')
 def get_task(id):
-    result = db.session.query(Task).filter_by(task_id=id).first()
+    if request.if_none_match or request.if_modified_since:
+        # conditional request: check the version before loading the row
+        version = db.reader().query(Task.revision, Task.updated_at) \
+            .filter_by(task_id=id).first()
+        if version is not None and not_modified(id, version):
+            return versioned(Response(status=304), id, version)
+
+    serializer = TaskSerializer()
+    result = serializer.query(Task.revision, Task.updated_at) \
+        .filter(Task.task_id == id).first()
     if result:
-        json_result = {
-            'task_id': result.task_id,
-            'task name': result.name,
-            'due date': str(result.due_date),
-            'priority': result.priority,
-            'posted date': str(result.posted_date),
-            'status': result.status,
-            'user id': result.user_id
-        }
-        code = 200
+        json_result = serializer.to_dict(result)
+        return versioned(json_response(json_result), id, result)
     else:
         json_result = {"error": "Element does not exist"}
         code = 404
-    return make_response(jsonify(json_result), code)
+    return json_response(json_result, code)
+
+
+@api_blueprint.route('/api/v1/tasks/export')
+def export_tasks():
+    """Stream every matching task as ndjson or csv."""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return bad_request("format must be one of: {0}".format(
+            ', '.join(sorted(EXPORT_FORMATS))))
+    try:
+        serializer = TaskSerializer(requested_fields())
+        query = filter_tasks(serializer.query())
+    except ValueError as e:
+        return bad_request(str(e))
+
+    # rows come off the cursor in batches rather than all at once, so
+    # memory use stays flat however big the table gets
+    rows = query.order_by(Task.task_id.asc()) \
+        .execution_options(stream_results=True) \
+        .yield_per(app.config['EXPORT_BATCH_SIZE'])
+    generate, mimetype = EXPORT_FORMATS[export_format]
+    response = Response(
+        stream_with_context(generate(rows, serializer)),
+        mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=tasks.{0}'.format(export_format)
+    return response
+
+
+@api_blueprint.route('/api/v1/stats')
+def stats():
+    """Open and closed task counts, plus the caller's own when logged in."""
+    return json_response(task_counts(session.get('user_id')))
+
+
+@api_blueprint.route('/api/v1/tasks/batch', methods=['POST'])
+@login_required
+def batch_tasks():
+    """Apply many create/complete/delete operations in one transaction.
+
+    Expects {"operations": [{"op": "create", "name": ..., "due_date": ...,
+    "priority": ...}, {"op": "complete", "task_id": ...}, ...]} and answers
+    with one result per operation, in order.
+    """
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') \
+        if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        return bad_request("expected a json object with an operations list")
+    if len(operations) > app.config['API_MAX_BATCH']:
+        return bad_request("at most {0} operations per batch".format(
+            app.config['API_MAX_BATCH']))
+
+    results = [None] * len(operations)
+    creates, changes = [], []
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        try:
+            if op == 'create':
+                creates.append((index, parse_new_task(operation)))
+            elif op in ('complete', 'delete'):
+                changes.append((index, op, parse_task_id(operation)))
+            else:
+                raise ValueError("op must be create, complete or delete")
+        except ValueError as e:
+            results[index] = {'op': op, 'status': 'error', 'error': str(e)}
+
+    # one query checks ownership for every complete and delete
+    allowed, errors = check_ownership(
+        [task_id for _, _, task_id in changes],
+        session['user_id'],
+        session['role'] == 'admin'
+    )
+    allowed = dict((row.task_id, row) for row in allowed)
+    to_complete, to_delete = [], []
+    for index, op, task_id in changes:
+        result = {'op': op, 'task_id': task_id, 'status': 'ok'}
+        if task_id in errors:
+            result.update(status='error', error=errors[task_id])
+        elif op == 'complete':
+            to_complete.append(allowed[task_id])
+        else:
+            to_delete.append(allowed[task_id])
+        results[index] = result
+
+    new_ids = create_tasks(
+        session['user_id'], [fields for _, fields in creates])
+    for (index, _), task_id in zip(creates, new_ids):
+        results[index] = {'op': 'create', 'task_id': task_id, 'status': 'ok'}
+    closed = complete_tasks(to_complete)
+    delete_tasks(to_delete)
+    db.session.commit()
+    cache.bump_generation()
+
+    today = str(datetime.datetime.utcnow().date())
+    for (_, fields), task_id in zip(creates, new_ids):
+        events.publish(task_event(
+            'created', task_id,
+            name=fields['name'],
+            due_date=str(fields['due_date']),
+            posted_date=today,
+            priority=fields['priority'],
+            posted_by=session['name']
+        ))
+    for task_id in closed:
+        events.publish(task_event('completed', task_id))
+    for row in unique_rows(to_delete):
+        events.publish(task_event('deleted', row.task_id))
+
+    return json_response({'results': results})
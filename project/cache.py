@@ -0,0 +1,291 @@
+"""Response caching for the dashboard and api.
+
+Cached entries are keyed on the view, the query string, the viewer (for
+per-user pages) and a generation token.  Every write to the tasks table
+bumps the generation, which retires all earlier entries at once, so
+nothing ever has to be deleted by hand.
+
+Fragments (the dashboard's task rows) are keyed on their own version
+instead, so they outlive generation bumps and a write only costs the
+rows it actually changed.  They live in a separate per-process cache:
+versioned keys need no invalidation between workers, and a FileCache
+would cost a file read per row.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import Markup, Response, g, make_response, request, session
+
+
+class NullCache(object):
+    """Cache that never stores anything."""
+
+    def get(self, key):
+        return None
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def set_many(self, mapping, timeout=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def generation(self):
+        return '0'
+
+    def bump_generation(self):
+        pass
+
+
+class LRUCache(object):
+    """In-process least-recently-used cache.
+
+    Entries and the generation live in this process only, so use it with
+    a single worker (or FileCache for several).
+    """
+
+    def __init__(self, threshold=500, default_timeout=300):
+        self.threshold = threshold
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = uuid.uuid4().hex
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Values for each of `keys`, None where missing or expired."""
+        now = time.time()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is None or entry[0] < now:
+                    values.append(None)
+                    continue
+                # re-inserting marks the entry as most recently used
+                self._entries[key] = entry
+                values.append(entry[1])
+        return values
+
+    def set(self, key, value, timeout=None):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        expires = time.time() + (timeout or self.default_timeout)
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (expires, value)
+            while len(self._entries) > self.threshold:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.bump_generation()
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        self._generation = uuid.uuid4().hex
+
+
+class FileCache(object):
+    """Cache kept in a directory, shared by every worker on the host."""
+
+    def __init__(self, cache_dir, threshold=500, default_timeout=300):
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.default_timeout = default_timeout
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self._generation_path = os.path.join(cache_dir, 'generation')
+
+    def _path(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.cache')
+
+    def _write(self, path, data):
+        # write then rename, so readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.PickleError):
+            return None
+        if expires < time.time():
+            return None
+        return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        expires = time.time() + (timeout or self.default_timeout)
+        # one prune per batch; it lists the whole directory
+        self._prune()
+        for key, value in mapping.items():
+            self._write(
+                self._path(key),
+                pickle.dumps((expires, value), pickle.HIGHEST_PROTOCOL)
+            )
+
+    def _entries(self):
+        return [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith('.cache')
+        ]
+
+    def _prune(self):
+        entries = self._entries()
+        if len(entries) < self.threshold:
+            return
+        # drop the oldest fifth rather than one file per set
+        entries.sort(key=lambda path: os.path.getmtime(path))
+        for path in entries[:max(1, len(entries) // 5)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.bump_generation()
+
+    def generation(self):
+        try:
+            with open(self._generation_path) as f:
+                return f.read()
+        except IOError:
+            self.bump_generation()
+            return self.generation()
+
+    def bump_generation(self):
+        self._write(self._generation_path, uuid.uuid4().hex.encode('ascii'))
+
+
+def make_cache(config):
+    """Build the cache selected by CACHE_TYPE."""
+    cache_type = config['CACHE_TYPE']
+    if cache_type == 'lru':
+        return LRUCache(
+            config['CACHE_THRESHOLD'], config['CACHE_DEFAULT_TIMEOUT'])
+    if cache_type == 'file':
+        return FileCache(
+            config['CACHE_DIR'],
+            config['CACHE_THRESHOLD'],
+            config['CACHE_DEFAULT_TIMEOUT']
+        )
+    if cache_type == 'null':
+        return NullCache()
+    raise ValueError("Unknown CACHE_TYPE {0!r}".format(cache_type))
+
+
+def make_row_cache(config):
+    """In-process cache for rendered dashboard rows."""
+    return LRUCache(config['ROW_CACHE_THRESHOLD'], config['ROW_CACHE_TIMEOUT'])
+
+
+def cached_view(cache, per_user=False):
+    """Cache a view's successful GET responses and answer revalidation.
+
+    Clients get an ETag derived from the cache key, so an unchanged page
+    comes back as a 304 without the view ever running.  Responses from a
+    request that set `g.uncacheable` are neither stored nor tagged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrap(*args, **kwargs):
+            # pending flash messages are part of the page; don't cache them
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            parts = [
+                request.endpoint,
+                request.query_string.decode('latin-1'),
+                cache.generation()
+            ]
+            if per_user:
+                parts += [
+                    session.get('user_id'),
+                    session.get('role'),
+                    session.get('csrf_token')
+                ]
+            key = 'view:' + ':'.join(str(part) for part in parts)
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                cached = cache.get(key)
+                if cached is None:
+                    response = make_response(view(*args, **kwargs))
+                    # a view that read from a lagging replica can't vouch
+                    # for the generation its answer would be cached under
+                    if response.status_code != 200 or \
+                            g.get('uncacheable'):
+                        return response
+                    cache.set(
+                        key, (response.get_data(), response.content_type))
+                else:
+                    data, content_type = cached
+                    response = Response(data, content_type=content_type)
+
+            response.set_etag(etag)
+            if per_user:
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Cookie')
+            else:
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrap
+    return decorator
+
+
+def cached_fragments(cache, items, key, render, timeout=None):
+    """Rendered markup for each of `items`, reusing cached fragments.
+
+    `key(item)` must change whenever the item's markup would, since
+    fragments are never invalidated otherwise; only the items missing
+    from the cache go through `render(item)`.  All lookups and stores
+    are batched into one call each.
+    """
+    keys = [key(item) for item in items]
+    fragments = cache.get_many(keys)
+    missing = {}
+    for index, fragment in enumerate(fragments):
+        if fragment is None:
+            fragment = fragments[index] = render(items[index])
+            missing[keys[index]] = fragment
+    if missing:
+        cache.set_many(missing, timeout)
+    return [Markup(fragment) for fragment in fragments]
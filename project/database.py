@@ -0,0 +1,109 @@
+"""SQLAlchemy setup tuned for a SQLite file shared by several workers.
+
+Reads that can tolerate a little lag go through `db.reader()`, which
+uses SQLALCHEMY_READ_DATABASE_URI when it is set (a replica, or a copy
+of the SQLite file) and the primary otherwise.  Writes always use
+`db.session`.  After a commit the user's reads stick to the primary for
+READ_AFTER_WRITE_SECONDS, so they see their own changes straight away.
+"""
+
+import sqlite3
+import threading
+import time
+
+from flask import _app_ctx_stack, g, has_request_context, session
+from flask.ext.sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import Pool, QueuePool
+
+
+def apply_pragmas(connection, pragmas):
+    """Run each (name, value) of `pragmas` on a sqlite3 connection."""
+    cursor = connection.cursor()
+    for name, value in pragmas:
+        cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+    cursor.close()
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy with pooled SQLite connections and a read engine.
+
+    Flask-SQLAlchemy opens a new SQLite connection for every session
+    unless SQLALCHEMY_POOL_SIZE is set; with it set, connections are kept
+    in a QueuePool instead, and every new one gets SQLITE_PRAGMAS.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._read_engine = None
+        self._read_uri = None
+        self._read_lock = threading.Lock()
+        self.read_session = orm.scoped_session(
+            self._create_read_session,
+            scopefunc=_app_ctx_stack.__ident_func__
+        )
+        super(Database, self).__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        super(Database, self).init_app(app)
+        pragmas = app.config.get('SQLITE_PRAGMAS') or []
+
+        @event.listens_for(Pool, 'connect')
+        def set_sqlite_pragmas(connection, record):
+            if isinstance(connection, sqlite3.Connection):
+                apply_pragmas(connection, pragmas)
+
+        @event.listens_for(SignallingSession, 'after_commit')
+        def read_own_writes(db_session):
+            if has_request_context():
+                session['read_primary_until'] = \
+                    time.time() + app.config['READ_AFTER_WRITE_SECONDS']
+
+        @app.teardown_appcontext
+        def shutdown_read_session(response_or_exc):
+            self.read_session.remove()
+            return response_or_exc
+
+    def read_engine(self):
+        """Engine for SQLALCHEMY_READ_DATABASE_URI, or None if unset."""
+        app = self.get_app()
+        uri = app.config.get('SQLALCHEMY_READ_DATABASE_URI')
+        if not uri:
+            return None
+        with self._read_lock:
+            if self._read_engine is None or self._read_uri != uri:
+                info = make_url(uri)
+                options = {'convert_unicode': True}
+                self.apply_pool_defaults(app, options)
+                self.apply_driver_hacks(app, info, options)
+                self._read_engine = create_engine(info, **options)
+                self._read_uri = uri
+            return self._read_engine
+
+    def _create_read_session(self):
+        return orm.Session(bind=self.read_engine(), autoflush=False)
+
+    def reader(self):
+        """Session for reads: the read engine unless the user just wrote.
+
+        A request that reads from the read engine is marked uncacheable:
+        the replica may not have caught up with the writes the response
+        cache's generation already reflects.
+        """
+        if self.read_engine() is None:
+            return self.session
+        if has_request_context():
+            if session.get('read_primary_until', 0) > time.time():
+                return self.session
+            g.uncacheable = True
+        return self.read_session
+
+    def apply_driver_hacks(self, app, info, options):
+        super(Database, self).apply_driver_hacks(app, info, options)
+        in_memory = info.database in (None, '', ':memory:')
+        if info.drivername == 'sqlite' and not in_memory and \
+                options.get('pool_size'):
+            options['poolclass'] = QueuePool
+            # pooled connections move between threads, one at a time
+            options.setdefault('connect_args', {})['check_same_thread'] = \
+                False
@@ -0,0 +1,229 @@
+"""Error log written in batches from a background thread.
+
+Request threads only put a record on a queue, so a burst of errors never
+blocks on file I/O.  The writer thread keeps the file open, flushes once
+per batch and rotates the file by size; workers sharing a file take a
+lock to rotate it, and follow each other's rotations.  Repeats of the same error are
+sampled so a crawler hammering one bad url can't flood the log.
+"""
+
+import atexit
+from collections import OrderedDict
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on Windows, where only the single process dev server runs
+    fcntl = None
+
+
+class ErrorLog(object):
+    """Queue-backed, size-rotated error log."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 json_lines=False, batch_size=200,
+                 sample_window=60, sample_limit=10, queue_size=10000,
+                 max_samples=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.json_lines = json_lines
+        self.batch_size = batch_size
+        self.sample_window = sample_window
+        self.sample_limit = sample_limit
+        self.max_samples = max_samples
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        # (status, url) -> (window start, count, skipped), oldest first
+        self._samples = OrderedDict()
+        self._swept = time.time()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._file = None
+        self._lock_file = None
+
+    # request side
+
+    def log(self, status, url, **fields):
+        """Queue an error record; never blocks the caller."""
+        now = time.time()
+        suppressed = self._sample((status, url), now)
+        if suppressed is None:
+            return
+        record = dict(fields, time=now, status=status, url=url)
+        if suppressed:
+            record['suppressed'] = suppressed
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _sample(self, key, now):
+        """Count an occurrence of `key` in the current window.
+
+        Returns None when the record should be skipped, otherwise how many
+        repeats were skipped since the last one that got through.
+        """
+        with self._lock:
+            if now - self._swept > self.sample_window:
+                self._expire(now)
+            if key not in self._samples and \
+                    len(self._samples) >= self.max_samples:
+                # a crawler spraying unique urls mustn't grow this forever
+                self._samples.popitem(last=False)
+            window_start, count, skipped = \
+                self._samples.get(key, (now, 0, 0))
+            if now - window_start > self.sample_window:
+                window_start, count = now, 0
+            count += 1
+            if count > self.sample_limit:
+                self._samples[key] = (window_start, count, skipped + 1)
+                return None
+            self._samples[key] = (window_start, count, 0)
+            return skipped
+
+    def _expire(self, now):
+        """Forget keys whose window has run out (caller holds the lock).
+
+        Keys with suppressed repeats stay until their next record reports
+        them, or until max_samples pushes them out.
+        """
+        for key, (window_start, _, skipped) in list(self._samples.items()):
+            if now - window_start > self.sample_window and not skipped:
+                del self._samples[key]
+        self._swept = now
+
+    def _ensure_writer(self):
+        # threads don't survive a fork, so each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                # files opened before a fork, and the flock on them, are
+                # shared with the parent, so this process opens its own
+                for f in (self._file, self._lock_file):
+                    if f is not None:
+                        f.close()
+                self._file = self._lock_file = None
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    # writer side
+
+    def _run(self):
+        while True:
+            # wait for one record, then take whatever else piled up while
+            # we were busy, so a burst is written with a single flush
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(''.join(self.format(r) for r in batch))
+            except (IOError, OSError):
+                # losing some log lines beats killing the writer thread
+                with self._lock:
+                    self.dropped += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def format(self, record):
+        """One line of log output for a record."""
+        if self.json_lines:
+            record = dict(record, time=datetime.datetime.utcfromtimestamp(
+                record['time']).isoformat() + 'Z')
+            return json.dumps(record, sort_keys=True) + '\n'
+        timestamp = datetime.datetime.fromtimestamp(record['time']) \
+            .strftime("%d-%m-%Y %H:%M:%S")
+        line = "{0} error at {1}:{2}".format(
+            record['status'], timestamp, record['url'])
+        if record.get('suppressed'):
+            line += " (+{0} similar suppressed)".format(record['suppressed'])
+        return line + '\n'
+
+    def _write(self, data):
+        with self._locked():
+            if self._file is not None and self._moved():
+                # another worker rotated it; follow the path
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            # the size on disk, since other workers append to it too
+            size = os.fstat(self._file.fileno()).st_size
+            if size and size + len(data) > self.max_bytes:
+                self._rotate()
+                self._file = open(self.path, 'a')
+            self._file.write(data)
+            self._file.flush()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the lock every process writing to `path` shares."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.path + '.lock', 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _moved(self):
+        """True if `path` no longer names the file we have open."""
+        try:
+            return os.stat(self.path).st_ino != \
+                os.fstat(self._file.fileno()).st_ino
+        except OSError:
+            return True
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            source = '{0}.{1}'.format(self.path, i)
+            if os.path.exists(source):
+                os.rename(source, '{0}.{1}'.format(self.path, i + 1))
+        if self.backup_count:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+
+def make_error_log(config):
+    """Build the error log described by the ERROR_LOG_* settings."""
+    return ErrorLog(
+        config['ERROR_LOG_PATH'],
+        max_bytes=config['ERROR_LOG_MAX_BYTES'],
+        backup_count=config['ERROR_LOG_BACKUP_COUNT'],
+        json_lines=config['ERROR_LOG_JSON'],
+        sample_window=config['ERROR_LOG_SAMPLE_WINDOW'],
+        sample_limit=config['ERROR_LOG_SAMPLE_LIMIT']
+    )
@@ -0,0 +1,213 @@
+"""Push task changes to open dashboards as server-sent events.
+
+Views publish an event after committing a change; every open stream
+subscribed to the broker gets a copy.  LocalBroker only reaches streams
+in the same process.  ChangeLogBroker instead polls the task_changes log
+that every worker writes, so each process sees every change; with it,
+publish() is a no-op.
+"""
+
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class TooManyStreams(Exception):
+    """Raised when the process already has its maximum of open streams."""
+
+
+def task_event(event_type, task_id, **task):
+    """Event dict for a task that was created, completed or deleted."""
+    task['task_id'] = task_id
+    return {'type': event_type, 'task': task}
+
+
+def format_event(event):
+    """One server-sent events message."""
+    lines = []
+    if event.get('seq') is not None:
+        lines.append('id: {0}'.format(event['seq']))
+    lines.append('event: {0}'.format(event['type']))
+    lines.append('data: {0}'.format(
+        json.dumps(event['task'], separators=(',', ':'))))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription(object):
+    """One stream's queue of pending events."""
+
+    def __init__(self, broker, size):
+        self.broker = broker
+        self.queue = queue.Queue(size)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # a client this far behind reloads instead of catching up
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout`."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(object):
+    """In-process pub/sub for task events."""
+
+    def __init__(self, max_subscribers=50, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManyStreams()
+            subscription = Subscription(self, self.queue_size)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def publish(self, event):
+        self._deliver(event)
+
+    def _deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+# every change after `seq`, with what a dashboard row needs
+CHANGES_SQL = text("""
+    SELECT c.seq, c.task_id, c.op, t.name, t.due_date, t.priority,
+           t.posted_date, t.status, u.name AS posted_by
+    FROM task_changes c
+    LEFT JOIN tasks t ON t.task_id = c.task_id
+    LEFT JOIN users u ON u.id = t.user_id
+    WHERE c.seq > :seq
+    ORDER BY c.seq
+    LIMIT 500
+""")
+
+EVENT_TYPES = {'create': 'created', 'update': 'completed', 'delete': 'deleted'}
+
+
+class ChangeLogBroker(LocalBroker):
+    """Broker fed by polling task_changes, so it works across workers.
+
+    One thread per process polls while anyone is subscribed; the log is
+    indexed by seq, so an idle poll is a single cheap query.
+    """
+
+    def __init__(self, db, poll_interval=1.0, **kwargs):
+        super(ChangeLogBroker, self).__init__(**kwargs)
+        self.db = db
+        self.poll_interval = poll_interval
+        self._pid = None
+        # last seq delivered; None while nobody is listening
+        self._seq = None
+
+    def publish(self, event):
+        # the poller picks the change up from the log
+        pass
+
+    def subscribe(self):
+        subscription = super(ChangeLogBroker, self).subscribe()
+        if self._seq is None:
+            # start from the log's end as of now, so nothing written
+            # before the poller's next look is missed
+            try:
+                self._seq = self._latest_seq()
+            except Exception:
+                # the poller keeps trying
+                pass
+        self._ensure_poller()
+        return subscription
+
+    def _latest_seq(self):
+        return self.db.engine.execute(
+            text("SELECT max(seq) FROM task_changes")).scalar() or 0
+
+    def _ensure_poller(self):
+        # threads don't survive a fork, so each worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self._subscribers:
+                # the next subscriber starts from the end of the log
+                self._seq = None
+                continue
+            try:
+                if self._seq is None:
+                    self._seq = self._latest_seq()
+                    continue
+                rows = self.db.engine.execute(
+                    CHANGES_SQL, seq=self._seq).fetchall()
+            except Exception:
+                # a locked or missing table just means trying again later
+                continue
+            for row in rows:
+                self._seq = row['seq']
+                self._deliver(self.event_for(row))
+
+    def event_for(self, row):
+        event_type = EVENT_TYPES.get(row['op'], 'completed')
+        if event_type == 'created' and row['name'] is not None:
+            event = task_event(
+                event_type, row['task_id'],
+                name=row['name'],
+                due_date=str(row['due_date']),
+                posted_date=str(row['posted_date']),
+                priority=row['priority'],
+                posted_by=row['posted_by']
+            )
+        else:
+            event = task_event(event_type, row['task_id'])
+        event['seq'] = row['seq']
+        return event
+
+
+def make_broker(config, db):
+    """Build the broker selected by EVENTS_BROKER."""
+    options = dict(max_subscribers=config['EVENTS_MAX_CONNECTIONS'])
+    if config['EVENTS_BROKER'] == 'local':
+        return LocalBroker(**options)
+    if config['EVENTS_BROKER'] == 'changelog':
+        return ChangeLogBroker(
+            db, poll_interval=config['EVENTS_POLL_INTERVAL'], **options)
+    raise ValueError("Unknown EVENTS_BROKER {0!r}".format(
+        config['EVENTS_BROKER']))
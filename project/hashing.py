@@ -0,0 +1,110 @@
+"""Password hashing with a configurable cost and bounded concurrency.
+
+bcrypt is deliberately slow, so a burst of logins could otherwise keep
+every worker thread busy hashing while ordinary page requests wait.  At
+most `workers` hashes run at once per process and at most `max_waiting`
+more queue for a slot; anything beyond that fails fast with HasherBusy,
+which the views turn into a 503.
+"""
+
+from contextlib import contextmanager
+import threading
+import uuid
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already running or waiting."""
+
+
+def hash_cost(pw_hash):
+    """The log rounds a bcrypt hash like $2b$12$... was made with."""
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode('ascii')
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher(object):
+    """Runs bcrypt through a fixed number of slots."""
+
+    def __init__(self, bcrypt, config, workers=2, max_waiting=8):
+        self.bcrypt = bcrypt
+        self.config = config
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.rejected = 0
+        self.dummy_checks = 0
+        self._dummy_hash = None
+        self._dummy_lock = threading.Lock()
+        self._slots = threading.Semaphore(workers)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rounds(self):
+        return self.config['BCRYPT_LOG_ROUNDS']
+
+    @contextmanager
+    def _slot(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_waiting:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+        try:
+            with self._slots:
+                yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def generate(self, password):
+        """Hash `password` at the configured cost."""
+        with self._slot():
+            return self.bcrypt.generate_password_hash(password, self.rounds)
+
+    def check(self, pw_hash, password):
+        """Whether `password` matches `pw_hash`."""
+        with self._slot():
+            return self.bcrypt.check_password_hash(pw_hash, password)
+
+    def check_user(self, user, password):
+        """Whether `password` is `user`'s; `user` may be None.
+
+        An unknown user is checked against a dummy hash of the same cost,
+        so the response takes as long as for a real one and doesn't give
+        away which usernames exist.
+        """
+        if user is None:
+            self.dummy_checks += 1
+            self._check_dummy(password)
+            return False
+        return self.check(user.password, password)
+
+    def _check_dummy(self, password):
+        with self._slot():
+            with self._dummy_lock:
+                if self._dummy_hash is None or \
+                        self.needs_rehash(self._dummy_hash):
+                    # making a hash costs about what checking one does,
+                    # so the first unknown user isn't slower than the rest
+                    self._dummy_hash = self.bcrypt.generate_password_hash(
+                        uuid.uuid4().hex, self.rounds)
+                    return
+            self.bcrypt.check_password_hash(self._dummy_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Whether `pw_hash` was made with a different cost than configured."""
+        return hash_cost(pw_hash) != self.rounds
+
+
+def make_hasher(config, bcrypt):
+    """Build the hasher described by the PASSWORD_HASH_* settings."""
+    return PasswordHasher(
+        bcrypt,
+        config,
+        workers=config['PASSWORD_HASH_WORKERS'],
+        max_waiting=config['PASSWORD_HASH_MAX_WAITING']
+    )
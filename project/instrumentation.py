@@ -0,0 +1,243 @@
+"""Opt-in per-request timing of SQL, template rendering and bcrypt.
+
+When INSTRUMENTATION_ENABLED is set every response gets a Server-Timing
+header, recent requests are summarized per route at INSTRUMENTATION_PATH
+(admins only), and requests slower than INSTRUMENTATION_SLOW_MS are
+written to the slow request log.  When it is off none of the hooks are
+installed, so it costs nothing.
+"""
+
+from collections import defaultdict, deque
+from functools import wraps
+import threading
+import time
+
+from flask import g, has_request_context, jsonify, make_response, \
+    request, session
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project.errorlog import ErrorLog
+
+# upper bounds (ms) of the histogram buckets on the stats page
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestTimings(object):
+    """What one request spent its time on."""
+
+    def __init__(self, keep_slowest):
+        self.started = time.time()
+        self.keep_slowest = keep_slowest
+        self.queries = 0
+        self.db = 0.0
+        self.slowest = []
+        self.template = 0.0
+        self.bcrypt = 0.0
+
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.db += seconds
+        self.slowest.append((seconds, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.keep_slowest:]
+
+
+def current_timings():
+    """Timings for the current request, or None outside of one."""
+    if has_request_context():
+        return getattr(g, 'timings', None)
+
+
+class TimedTemplate(Template):
+    """Jinja template that adds its render time to the request."""
+
+    def render(self, *args, **kwargs):
+        timings = current_timings()
+        if timings is None:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        started = time.time()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            timings.template += time.time() - started
+
+
+def timed_bcrypt(function):
+    """Wrap a bcrypt method so its time is added to the request."""
+    @wraps(function)
+    def wrap(*args, **kwargs):
+        timings = current_timings()
+        started = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if timings is not None:
+                timings.bcrypt += time.time() - started
+    return wrap
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(time.time())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    started = conn.info['query_started'].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings.add_query(statement, time.time() - started)
+
+
+def handle_error(context):
+    # a failed statement never reaches after_cursor_execute; drop its
+    # start time so later queries don't pop the wrong one
+    conn = context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+def percentile(ordered, pct):
+    return ordered[max(0, int(round(pct / 100.0 * len(ordered))) - 1)]
+
+
+class Instrumentation(object):
+    """Hooks the timers into the app and keeps rolling per-route stats."""
+
+    def __init__(self, app, bcrypt):
+        self.app = app
+        self.bcrypt = bcrypt
+        self.installed = False
+        self._lock = threading.Lock()
+        self._routes = defaultdict(
+            lambda: deque(maxlen=app.config['INSTRUMENTATION_WINDOW']))
+        self._original_bcrypt = {}
+        self._original_template_class = None
+        self.slow_log = ErrorLog(
+            app.config['INSTRUMENTATION_SLOW_LOG_PATH'], json_lines=True)
+
+    def install(self):
+        """Start timing every request."""
+        if self.installed:
+            return
+        app = self.app
+        app.before_request_funcs.setdefault(None, []) \
+            .insert(0, self.start_request)
+        app.after_request_funcs.setdefault(None, []) \
+            .append(self.finish_request)
+        if 'instrumentation.stats' not in app.view_functions:
+            app.add_url_rule(
+                app.config['INSTRUMENTATION_PATH'],
+                'instrumentation.stats',
+                self.stats_view
+            )
+        self._original_template_class = app.jinja_env.template_class
+        self.set_template_class(TimedTemplate)
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+        for name in ('generate_password_hash', 'check_password_hash'):
+            method = getattr(self.bcrypt, name)
+            self._original_bcrypt[name] = method
+            setattr(self.bcrypt, name, timed_bcrypt(method))
+        self.installed = True
+
+    def uninstall(self):
+        """Stop timing requests (mostly for tests)."""
+        if not self.installed:
+            return
+        self.app.before_request_funcs[None].remove(self.start_request)
+        self.app.after_request_funcs[None].remove(self.finish_request)
+        self.set_template_class(self._original_template_class)
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.remove(Engine, 'handle_error', handle_error)
+        for name, method in self._original_bcrypt.items():
+            setattr(self.bcrypt, name, method)
+        self._original_bcrypt = {}
+        self.installed = False
+
+    def set_template_class(self, template_class):
+        """Render with `template_class`, including templates loaded already."""
+        jinja_env = self.app.jinja_env
+        jinja_env.template_class = template_class
+        if jinja_env.cache is not None:
+            jinja_env.cache.clear()
+
+    # request hooks
+
+    def start_request(self):
+        g.timings = RequestTimings(
+            self.app.config['INSTRUMENTATION_SLOWEST_QUERIES'])
+
+    def finish_request(self, response):
+        timings = current_timings()
+        if timings is None:
+            return response
+        total = (time.time() - timings.started) * 1000
+        response.headers['Server-Timing'] = ', '.join([
+            'db;dur={0:.2f};desc="{1} queries"'.format(
+                timings.db * 1000, timings.queries),
+            'tpl;dur={0:.2f}'.format(timings.template * 1000),
+            'bcrypt;dur={0:.2f}'.format(timings.bcrypt * 1000),
+            'total;dur={0:.2f}'.format(total),
+        ])
+
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        with self._lock:
+            self._routes[route].append(
+                (total, timings.queries, timings.db * 1000))
+
+        if total >= self.app.config['INSTRUMENTATION_SLOW_MS']:
+            self.slow_log.log(
+                response.status_code,
+                request.url,
+                method=request.method,
+                route=route,
+                duration_ms=round(total, 2),
+                queries=timings.queries,
+                db_ms=round(timings.db * 1000, 2),
+                template_ms=round(timings.template * 1000, 2),
+                bcrypt_ms=round(timings.bcrypt * 1000, 2),
+                slowest_queries=[
+                    {'ms': round(seconds * 1000, 2), 'sql': statement}
+                    for seconds, statement in timings.slowest
+                ]
+            )
+        return response
+
+    # stats
+
+    def stats(self):
+        """Summary of the recent requests to each route."""
+        with self._lock:
+            samples = dict(
+                (route, list(recent)) for route, recent in
+                self._routes.items())
+        summary = {}
+        for route, recent in samples.items():
+            durations = sorted(total for total, _, _ in recent)
+            histogram = dict(
+                ('le_{0}'.format(bound),
+                 sum(1 for d in durations if d <= bound))
+                for bound in BUCKETS)
+            histogram['le_inf'] = len(durations)
+            summary[route] = {
+                'requests': len(durations),
+                'p50_ms': round(percentile(durations, 50), 2),
+                'p95_ms': round(percentile(durations, 95), 2),
+                'p99_ms': round(percentile(durations, 99), 2),
+                'mean_queries': round(
+                    sum(q for _, q, _ in recent) / float(len(recent)), 2),
+                'mean_db_ms': round(
+                    sum(d for _, _, d in recent) / float(len(recent)), 2),
+                'histogram': histogram,
+            }
+        return summary
+
+    def stats_view(self):
+        if session.get('role') != 'admin':
+            return make_response(jsonify(error='Admins only'), 403)
+        return jsonify(routes=self.stats())
@@ -7,6 +7,12 @@ import datetime
 class Task(db.Model):
 
     __tablename__ = "tasks"
+    __table_args__ = (
+        # dashboard lists filter on status and page through due_date
+        db.Index('ix_tasks_status_due_date', 'status', 'due_date', 'task_id'),
+        # ownership checks and per-user listings
+        db.Index('ix_tasks_user_id_status', 'user_id', 'status'),
+    )
 
     task_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -15,6 +21,13 @@ class Task(db.Model):
     posted_date = db.Column(db.Date, default=datetime.datetime.utcnow())
     status = db.Column(db.Integer)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # bumped on every change; api clients use it to revalidate cheaply
+    revision = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow
+    )
 
     def __init__(self, name, due_date, priority, posted_date, status, user_id):
         self.name = name
@@ -28,6 +41,54 @@ class Task(db.Model):
         return '<name {0}>'.format(self.name)
 
 
+class TaskStats(db.Model):
+    """Open and closed task counts, kept up to date by tasks.operations.
+
+    There is a row per user, plus the GLOBAL_STATS row with the totals.
+    """
+
+    __tablename__ = "task_stats"
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    open_count = db.Column(db.Integer, nullable=False, default=0)
+    closed_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# TaskStats.user_id of the row counting every user's tasks
+GLOBAL_STATS = 0
+
+
+class TaskChange(db.Model):
+    """Append-only log of task changes for incremental api sync.
+
+    seq only ever grows (AUTOINCREMENT never hands out an old value, even
+    after compaction), so it works as a cursor.  A 'delete' entry is the
+    tombstone telling clients to drop the task.
+    """
+
+    __tablename__ = "task_changes"
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String, nullable=False)
+    changed_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+class ChangeHorizon(db.Model):
+    """Highest seq whose tombstone compaction has thrown away.
+
+    Clients syncing from before it may have missed deletes and have to
+    start over.  The table holds at most one row.
+    """
+
+    __tablename__ = "task_changes_horizon"
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+
+
 class User(db.Model):
 
     __tablename__ = "users"
@@ -47,3 +108,9 @@ class User(db.Model):
 
     def __repr__(self):
         return '<User {0}>'.format(self.name)
+
+
+# project.search hangs the full-text index off the tasks table; importing
+# it here means anything that builds the schema, db_create.py included,
+# gets the index and its triggers, not just processes that load the views
+import project.search  # noqa
@@ -0,0 +1,79 @@
+"""Keyset pagination helpers."""
+
+import datetime
+
+from sqlalchemy import or_
+
+from project.models import Task
+
+
+class Page(object):
+    """One page of tasks ordered by (due_date, task_id)."""
+
+    def __init__(self, items, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def next_cursor(self):
+        """Cursor pointing just past the last item on this page."""
+        if self.has_next and self.items:
+            return encode_cursor(self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        """Cursor pointing just before the first item on this page."""
+        if self.has_prev and self.items:
+            return encode_cursor(self.items[0])
+
+
+def encode_cursor(task):
+    """Turn a task (or row) into an opaque 'due_date.task_id' cursor."""
+    return '{0}.{1}'.format(task.due_date.isoformat(), task.task_id)
+
+
+def decode_cursor(cursor):
+    """Parse a cursor back into (due_date, task_id).
+
+    Raises ValueError when the cursor is malformed.
+    """
+    due_date, _, task_id = cursor.partition('.')
+    return (
+        datetime.datetime.strptime(due_date, '%Y-%m-%d').date(),
+        int(task_id)
+    )
+
+
+def paginate(query, after=None, before=None, per_page=25):
+    """Return a Page of `query` keyed on (due_date, task_id).
+
+    `after` and `before` are decoded cursors; at most one should be given.
+    Only `per_page + 1` rows are ever fetched, however large the table.
+    """
+    query = query.order_by(None)
+
+    if before is not None:
+        due_date, task_id = before
+        rows = query.filter(Task.due_date <= due_date) \
+            .filter(or_(Task.due_date < due_date, Task.task_id < task_id)) \
+            .order_by(Task.due_date.desc(), Task.task_id.desc()) \
+            .limit(per_page + 1).all()
+        if len(rows) > per_page:
+            return Page(list(reversed(rows[:per_page])), True, True)
+        # ran off the front of the list, so just show the first page
+        after = None
+    elif after is not None:
+        due_date, task_id = after
+        query = query.filter(Task.due_date >= due_date) \
+            .filter(or_(Task.due_date > due_date, Task.task_id > task_id))
+
+    rows = query.order_by(Task.due_date.asc(), Task.task_id.asc()) \
+        .limit(per_page + 1).all()
+    return Page(rows[:per_page], len(rows) > per_page, after is not None)
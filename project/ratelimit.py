@@ -0,0 +1,127 @@
+"""Sliding-window throttling of failed logins.
+
+Failed attempts are counted per client address and per username.  Once
+either goes over its limit within the window, further login posts are
+turned away before the form is validated, the user is looked up or
+bcrypt runs, which is what keeps a brute-force run from eating the CPU.
+"""
+
+from collections import deque
+import threading
+import time
+
+
+class MemoryWindows(object):
+    """Recent hit times per key, kept in this process."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def hits(self, key, window, now):
+        """Times of the hits on `key` within the last `window` seconds."""
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return []
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            return list(hits)
+
+    def add(self, key, window, now):
+        with self._lock:
+            if key not in self._hits and len(self._hits) >= self.max_keys:
+                self._forget_idle(window, now)
+            self._hits.setdefault(key, deque()).append(now)
+
+    def _forget_idle(self, window, now):
+        for key in [k for k, hits in self._hits.items()
+                    if not hits or hits[-1] <= now - window]:
+            del self._hits[key]
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class CacheWindows(object):
+    """Recent hit times per key, kept in the response cache.
+
+    With the file cache every worker sees the same counts.  Updates are
+    read-modify-write without a lock, so concurrent failures can undercount
+    slightly, which is fine for throttling.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def hits(self, key, window, now):
+        return [t for t in self.cache.get('throttle:' + key) or []
+                if t > now - window]
+
+    def add(self, key, window, now):
+        hits = self.hits(key, window, now) + [now]
+        self.cache.set('throttle:' + key, hits, timeout=window)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class LoginThrottle(object):
+    """Limits failed logins per address and per username."""
+
+    def __init__(self, windows, ip_limit=20, user_limit=5, window=300):
+        self.windows = windows
+        self.ip_limit = ip_limit
+        self.user_limit = user_limit
+        self.window = window
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _keys(self, ip, username):
+        keys = [('ip:{0}'.format(ip), self.ip_limit)]
+        if username:
+            keys.append(
+                ('user:{0}'.format(username.strip().lower()),
+                 self.user_limit))
+        return keys
+
+    def retry_after(self, ip, username):
+        """Seconds until another attempt is allowed, or None if it is now."""
+        now = time.time()
+        wait = None
+        for key, limit in self._keys(ip, username):
+            hits = self.windows.hits(key, self.window, now)
+            if len(hits) >= limit:
+                # the attempt that frees a slot is the limit-th most recent
+                free_at = hits[-limit] + self.window
+                wait = max(wait or 0, free_at - now)
+        if wait is not None:
+            with self._lock:
+                self.rejected += 1
+        return wait
+
+    def failed(self, ip, username):
+        """Count a failed login attempt."""
+        now = time.time()
+        for key, _ in self._keys(ip, username):
+            self.windows.add(key, self.window, now)
+
+    def reset(self):
+        self.windows.clear()
+        self.rejected = 0
+
+
+def make_login_throttle(config, cache):
+    """Build the throttle described by the LOGIN_THROTTLE_* settings."""
+    if config['LOGIN_THROTTLE_SHARED']:
+        windows = CacheWindows(cache)
+    else:
+        windows = MemoryWindows()
+    return LoginThrottle(
+        windows,
+        ip_limit=config['LOGIN_THROTTLE_IP_LIMIT'],
+        user_limit=config['LOGIN_THROTTLE_USER_LIMIT'],
+        window=config['LOGIN_THROTTLE_WINDOW']
+    )
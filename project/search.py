@@ -0,0 +1,140 @@
+"""Full-text search over task names.
+
+tasks_fts is an SQLite FTS5 index over tasks.name.  It stores no copy of
+the text (content='tasks'), and triggers keep it in step with every
+insert, delete and rename, whichever code path makes them.  Matches are
+ranked with bm25, best first.
+
+SQLite builds without FTS5 get no index; search then falls back to a
+LIKE scan over the names, in task id order.
+"""
+
+import re
+import sqlite3
+
+from sqlalchemy import Column, DDL, Integer, MetaData, String, Table, event
+
+from project.models import Task
+
+# statements that add the index to a database that already has `tasks`
+CREATE_FTS = [
+    # prefix='3' also indexes 3 letter prefixes, the shortest match_query
+    # asks for (see MIN_PREFIX), so they don't scan the whole vocabulary
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        name, content='tasks', content_rowid='task_id', prefix='3')""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (rowid, name) VALUES (new.task_id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, name)
+        VALUES ('delete', old.task_id, old.name);
+    END""",
+    # only renames touch the index; completing a task doesn't
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+    AFTER UPDATE OF name ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, name)
+        VALUES ('delete', old.task_id, old.name);
+        INSERT INTO tasks_fts (rowid, name) VALUES (new.task_id, new.name);
+    END""",
+]
+
+# fill the index from the rows already in `tasks`
+REBUILD_FTS = "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')"
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS tasks_fts_insert",
+    "DROP TRIGGER IF EXISTS tasks_fts_delete",
+    "DROP TRIGGER IF EXISTS tasks_fts_update",
+    "DROP TABLE IF EXISTS tasks_fts",
+]
+
+_fts5 = []
+
+
+def has_fts5():
+    """True if the SQLite library this process uses includes FTS5."""
+    if not _fts5:
+        connection = sqlite3.connect(':memory:')
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE fts5_probe USING fts5(name)")
+            _fts5.append(True)
+        except sqlite3.OperationalError:
+            _fts5.append(False)
+        finally:
+            connection.close()
+    return _fts5[0]
+
+
+def _create_fts(ddl, target, bind, **kw):
+    return has_fts5()
+
+
+for statement in CREATE_FTS:
+    event.listen(Task.__table__, 'after_create',
+                 DDL(statement).execute_if(
+                     dialect='sqlite', callable_=_create_fts))
+for statement in DROP_FTS:
+    event.listen(Task.__table__, 'before_drop',
+                 DDL(statement).execute_if(dialect='sqlite'))
+
+# shorter words only match whole words: a one or two letter prefix
+# matches so much of a big table that ranking it all gets slow.  Keep
+# the prefix= option of tasks_fts in step with it
+MIN_PREFIX = 3
+
+# kept out of db.metadata so create_all never tries to make it a plain table
+tasks_fts = Table(
+    'tasks_fts', MetaData(),
+    Column('rowid', Integer),
+    Column('name', String),
+    Column('rank'),
+)
+
+
+def match_query(text):
+    """FTS5 query matching every word of `text` as a prefix.
+
+    Words are quoted, so nothing the user types is read as FTS syntax.
+    Returns None when `text` has no words in it.
+    """
+    words = re.findall(r'\w+', text, re.UNICODE)
+    if not words:
+        return None
+    return ' '.join(
+        '"{0}"*'.format(word) if len(word) >= MIN_PREFIX
+        else '"{0}"'.format(word)
+        for word in words
+    )
+
+
+def like_pattern(word):
+    """LIKE pattern matching `word` anywhere in a name."""
+    # \w+ words can't hold % or \, but an underscore would match anything
+    return '%' + word.replace('_', '\\_') + '%'
+
+
+def search(query, text):
+    """Restrict a query on tasks to those matching `text`, best first."""
+    if not has_fts5():
+        for word in re.findall(r'\w+', text, re.UNICODE):
+            query = query.filter(
+                Task.name.like(like_pattern(word), escape='\\'))
+        return query.order_by(Task.task_id)
+    return query.join(tasks_fts, tasks_fts.c.rowid == Task.task_id) \
+        .filter(tasks_fts.c.name.match(match_query(text))) \
+        .order_by(tasks_fts.c.rank, Task.task_id)
+
+
+def search_page(query, text, page, per_page):
+    """Rows on 1-based `page` of the ranked matches, and whether more follow.
+
+    Ranked results have no stable key to page on, so this uses an
+    offset; SEARCH_MAX_PAGES keeps deep (and slow) offsets out of reach.
+    """
+    rows = search(query, text) \
+        .limit(per_page + 1).offset((page - 1) * per_page).all()
+    return rows[:per_page], len(rows) > per_page
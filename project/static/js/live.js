@@ -0,0 +1,109 @@
+// Keeps the dashboard's task tables current from the /tasks/stream
+// server-sent events, so colleagues' changes show up without a reload.
+$(function () {
+    var $dashboard = $('#dashboard');
+    if (!$dashboard.length || !window.EventSource) {
+        return;
+    }
+    var user = $dashboard.data('user');
+    var admin = $dashboard.data('admin') === true;
+    var source = new EventSource($dashboard.data('stream'));
+
+    function taskUrl(name, taskId) {
+        return $dashboard.data(name + '-url').replace('/0/', '/' + taskId + '/');
+    }
+
+    function link(name, taskId, label) {
+        return $('<a>').attr('href', taskUrl(name, taskId)).text(label);
+    }
+
+    function actionsCell(taskId, postedBy, open) {
+        var $cell = $('<td>');
+        if (postedBy !== user && !admin) {
+            return $cell.text('N/A');
+        }
+        if (open) {
+            $cell.append(link('complete', taskId, 'Complete'), ' | ');
+        }
+        return $cell.append(link('delete', taskId, 'Delete'));
+    }
+
+    function sortsBefore(dueDate, taskId, $row) {
+        var rowDate = String($row.data('due-date'));
+        var rowId = Number($row.data('task-id'));
+        return dueDate < rowDate || (dueDate === rowDate && taskId < rowId);
+    }
+
+    // put a row where the server's (due date, id) order would
+    function insertRow($table, $row) {
+        var dueDate = String($row.data('due-date'));
+        var taskId = Number($row.data('task-id'));
+        var $rows = $table.find('tr[data-task-id]');
+        for (var i = 0; i < $rows.length; i++) {
+            if (sortsBefore(dueDate, taskId, $rows.eq(i))) {
+                $rows.eq(i).before($row);
+                return;
+            }
+        }
+        // past the end of this page: it belongs on a later one
+        if ($table.closest('.entries').find('.pager a.next').length) {
+            return;
+        }
+        if ($rows.length) {
+            $rows.last().after($row);
+        } else {
+            $table.append($row);
+        }
+    }
+
+    function findRow(taskId) {
+        return $('#open-tasks, #closed-tasks').find(
+            'tr[data-task-id="' + taskId + '"]');
+    }
+
+    source.addEventListener('created', function (e) {
+        var task = JSON.parse(e.data);
+        if (findRow(task.task_id).length) {
+            return;
+        }
+        var $row = $('<tr>')
+            .attr('data-task-id', task.task_id)
+            .attr('data-due-date', task.due_date)
+            .data('task-id', task.task_id)
+            .data('due-date', task.due_date)
+            .append(
+                $('<td>').text(task.task_id),
+                $('<td>').text(task.name),
+                $('<td>').text(task.due_date),
+                $('<td>').text(task.posted_date),
+                $('<td>').text(task.priority),
+                $('<td>').text(task.posted_by),
+                actionsCell(task.task_id, task.posted_by, true)
+            );
+        insertRow($('#open-tasks'), $row);
+    });
+
+    source.addEventListener('completed', function (e) {
+        var task = JSON.parse(e.data);
+        var $row = $('#open-tasks').find(
+            'tr[data-task-id="' + task.task_id + '"]');
+        if (!$row.length) {
+            return;
+        }
+        $row.detach();
+        var postedBy = $row.children().eq(5).text();
+        $row.children().last().replaceWith(
+            actionsCell(task.task_id, postedBy, false));
+        insertRow($('#closed-tasks'), $row);
+    });
+
+    source.addEventListener('deleted', function (e) {
+        findRow(JSON.parse(e.data).task_id).remove();
+    });
+
+    // the server fell too far behind to patch the page
+    source.addEventListener('reload', function () {
+        source.close();
+        window.location.reload();
+    });
+});
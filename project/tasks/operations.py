@@ -0,0 +1,284 @@
+"""Task mutations shared by the dashboard and the batch api.
+
+None of these commit; callers group as many as they like into a single
+transaction and commit once.  Each mutation also updates the task_stats
+counters and appends to the task_changes log in that same transaction.
+"""
+
+from collections import defaultdict
+import datetime
+
+from sqlalchemy import and_, case, func, select
+
+from project import db
+from project.models import (
+    GLOBAL_STATS,
+    ChangeHorizon,
+    Task,
+    TaskChange,
+    TaskStats,
+)
+
+
+def check_ownership(task_ids, user_id, is_admin):
+    """Look up `task_ids` in one query and split them by permission.
+
+    Returns (allowed, errors): the rows the user may change, and a dict of
+    task_id -> reason for the rest.
+    """
+    if not task_ids:
+        return [], {}
+    rows = db.session.query(
+        Task.task_id, Task.name, Task.status, Task.user_id
+    ).filter(Task.task_id.in_(set(task_ids))).all()
+    found = dict((row.task_id, row) for row in rows)
+
+    allowed, errors = [], {}
+    for task_id in task_ids:
+        row = found.get(task_id)
+        if row is None:
+            errors[task_id] = 'not found'
+        elif row.user_id != user_id and not is_admin:
+            errors[task_id] = 'forbidden'
+        else:
+            allowed.append(row)
+    return allowed, errors
+
+
+def unique_rows(rows):
+    """`rows` without repeats of the same task_id, first one kept."""
+    seen = set()
+    unique = []
+    for row in rows:
+        if row.task_id not in seen:
+            seen.add(row.task_id)
+            unique.append(row)
+    return unique
+
+
+def create_tasks(user_id, items):
+    """Insert tasks for `user_id` in the current transaction.
+
+    `items` are dicts of name, due_date and priority.  Returns the new
+    task ids in the same order.
+    """
+    if not items:
+        return []
+    now = datetime.datetime.utcnow()
+    insert = Task.__table__.insert()
+    # an executemany doesn't report the keys it generated, so insert row
+    # by row and take each id from the database rather than guessing it
+    task_ids = [
+        db.session.execute(insert, dict(
+            name=item['name'],
+            due_date=item['due_date'],
+            priority=item['priority'],
+            posted_date=now,
+            status='1',
+            user_id=user_id
+        )).inserted_primary_key[0]
+        for item in items
+    ]
+    adjust_stats({user_id: (len(items), 0)})
+    record_changes('create', task_ids)
+    return task_ids
+
+
+def ids_by_user(rows):
+    """{user_id: [task_id, ...]} for `rows`."""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.user_id].append(row.task_id)
+    return grouped
+
+
+def complete_tasks(rows):
+    """Close the given (already ownership checked) task rows.
+
+    Only tasks still open are closed, counted and logged, so a task that
+    is already closed (say by a concurrent request) changes nothing.
+    Returns the ids of the tasks it closed, in the order given.
+    """
+    rows = unique_rows(rows)
+    closed_ids = set()
+    deltas = {}
+    for user_id, task_ids in ids_by_user(rows).items():
+        open_ids = [
+            task_id for task_id, in db.session.query(Task.task_id)
+            .filter(Task.task_id.in_(task_ids), Task.status == 1)
+        ]
+        if not open_ids:
+            continue
+        closed = db.session.query(Task) \
+            .filter(Task.task_id.in_(open_ids), Task.status == 1) \
+            .update(
+                {'status': '0', 'revision': Task.revision + 1},
+                synchronize_session=False
+            )
+        deltas[user_id] = (-closed, closed)
+        closed_ids.update(open_ids)
+    adjust_stats(deltas)
+    closed_ids = [row.task_id for row in rows if row.task_id in closed_ids]
+    record_changes('update', closed_ids)
+    return closed_ids
+
+
+def delete_tasks(rows):
+    """Delete the given (already ownership checked) task rows.
+
+    Open and closed tasks are deleted separately, so the counters follow
+    each task's status at delete time rather than when it was looked up.
+    """
+    rows = unique_rows(rows)
+    if rows:
+        deltas = {}
+        for user_id, task_ids in ids_by_user(rows).items():
+            matching = db.session.query(Task).filter(Task.task_id.in_(task_ids))
+            opened = matching.filter(Task.status == 1) \
+                .delete(synchronize_session=False)
+            # whatever is left of them is closed
+            closed = matching.delete(synchronize_session=False)
+            deltas[user_id] = (-opened, -closed)
+        adjust_stats(deltas)
+        record_changes('delete', [row.task_id for row in rows])
+
+
+def record_changes(op, task_ids):
+    """Append one task_changes entry per task id with a single insert."""
+    if task_ids:
+        now = datetime.datetime.utcnow()
+        db.session.execute(TaskChange.__table__.insert(), [
+            dict(task_id=task_id, op=op, changed_at=now)
+            for task_id in task_ids
+        ])
+
+
+def compact_changes(tombstone_age):
+    """Shrink the change log; returns the number of entries removed.
+
+    Entries superseded by a later one for the same task go first, which
+    loses nothing: a client syncing from any seq still meets the latest
+    change.  Tombstones older than `tombstone_age` (a timedelta) go too,
+    and the change horizon moves past them.
+    """
+    table = TaskChange.__table__
+    latest = select([func.max(table.c.seq)]).group_by(table.c.task_id)
+    removed = db.session.execute(
+        table.delete().where(~table.c.seq.in_(latest))
+    ).rowcount
+
+    old = and_(
+        table.c.op == 'delete',
+        table.c.changed_at < datetime.datetime.utcnow() - tombstone_age
+    )
+    horizon = db.session.execute(
+        select([func.max(table.c.seq)]).where(old)).scalar()
+    if horizon is not None:
+        removed += db.session.execute(table.delete().where(old)).rowcount
+        current = db.session.query(ChangeHorizon).first()
+        if current is None:
+            db.session.add(ChangeHorizon(seq=horizon))
+        elif current.seq < horizon:
+            current.seq = horizon
+    return removed
+
+
+def change_horizon():
+    """Seq before which clients can no longer sync incrementally."""
+    return db.reader().query(ChangeHorizon.seq).scalar() or 0
+
+
+def adjust_stats(deltas):
+    """Add {user_id: (open, closed)} to each user's and the global counts.
+
+    Users (or the global row) sharing the same change are updated with a
+    single statement.  A counter row that doesn't exist yet is counted
+    from scratch instead, so call this after changing the tasks.
+    """
+    groups = defaultdict(list)
+    total_open = total_closed = 0
+    for user_id, (opened, closed) in deltas.items():
+        total_open += opened
+        total_closed += closed
+        if user_id is not None and (opened or closed):
+            groups[(opened, closed)].append(user_id)
+    if not total_open and not total_closed:
+        return
+    groups[(total_open, total_closed)].append(GLOBAL_STATS)
+
+    # a pending ORM insert has to reach the table before anything counts it
+    db.session.flush()
+    table = TaskStats.__table__
+    updated = 0
+    for (opened, closed), user_ids in groups.items():
+        updated += db.session.execute(
+            table.update()
+            .where(table.c.user_id.in_(user_ids))
+            .values(open_count=table.c.open_count + opened,
+                    closed_count=table.c.closed_count + closed)
+        ).rowcount
+
+    user_ids = [user_id for ids in groups.values() for user_id in ids]
+    if updated < len(user_ids):
+        existing = set(user_id for user_id, in db.session.query(
+            TaskStats.user_id).filter(TaskStats.user_id.in_(user_ids)))
+        recount_stats([i for i in user_ids if i not in existing])
+
+
+def recount_stats(user_ids=None):
+    """Rebuild counters from the tasks table: all of them, or `user_ids`.
+
+    Returns the number of counter rows written.
+    """
+    counts = db.session.query(
+        Task.user_id,
+        func.count(case([(Task.status == 1, 1)])),
+        func.count(case([(Task.status == 0, 1)]))
+    ).group_by(Task.user_id)
+    if user_ids is not None:
+        counts = counts.filter(Task.user_id.in_(user_ids))
+    counts = dict(
+        (user_id, (opened, closed)) for user_id, opened, closed in counts
+        if user_id is not None
+    )
+
+    if user_ids is None or GLOBAL_STATS in user_ids:
+        counts[GLOBAL_STATS] = tuple(db.session.query(
+            func.count(case([(Task.status == 1, 1)])),
+            func.count(case([(Task.status == 0, 1)]))
+        ).one())
+    if user_ids is not None:
+        # users without any tasks still get a row, of zeros
+        for user_id in user_ids:
+            counts.setdefault(user_id, (0, 0))
+
+    table = TaskStats.__table__
+    delete = table.delete()
+    if user_ids is not None:
+        delete = delete.where(table.c.user_id.in_(user_ids))
+    db.session.execute(delete)
+    if counts:
+        db.session.execute(table.insert(), [
+            dict(user_id=user_id, open_count=opened, closed_count=closed)
+            for user_id, (opened, closed) in counts.items()
+        ])
+    return len(counts)
+
+
+def task_counts(user_id=None):
+    """Global counters and, with `user_id`, that user's, from one query.
+
+    Returns {'open': n, 'closed': n} for the global counts and, when asked
+    for, the same under 'user'.
+    """
+    ids = [GLOBAL_STATS] if user_id is None else [GLOBAL_STATS, user_id]
+    rows = dict(
+        (row.user_id, {'open': row.open_count, 'closed': row.closed_count})
+        for row in db.reader().query(TaskStats)
+        .filter(TaskStats.user_id.in_(ids))
+    )
+    empty = {'open': 0, 'closed': 0}
+    counts = dict(rows.get(GLOBAL_STATS, empty))
+    if user_id is not None:
+        counts['user'] = rows.get(user_id, empty)
+    return counts
@@ -2,20 +2,39 @@
 
 from functools import wraps
 import datetime
+import time
 
 from flask import (
+    abort,
     Blueprint,
     flash,
+    Markup,
     redirect,
     request,
     render_template,
+    Response,
     session,
     url_for,
 )
 
+from sqlalchemy.orm import joinedload
+
 from .forms import AddTaskForm
-from project import db
+from .operations import (
+    adjust_stats,
+    check_ownership,
+    complete_tasks,
+    delete_tasks,
+    record_changes,
+    task_counts,
+)
+from project import app, cache, db, events, row_cache
+from project.api.serializers import TaskSerializer, json_response
+from project.cache import cached_fragments, cached_view
+from project.events import TooManyStreams, format_event, task_event
 from project.models import Task
+from project.pagination import decode_cursor, paginate
+from project.search import match_query, search_page
 
 
 # config
@@ -41,27 +60,187 @@ def login_required(test):
 
 def open_tasks():
     """Return open tasks."""
-    return db.session.query(Task) \
-        .filter_by(status='1').order_by(Task.due_date.asc())
+    return db.reader().query(Task) \
+        .options(joinedload(Task.poster)) \
+        .filter_by(status='1') \
+        .order_by(Task.due_date.asc(), Task.task_id.asc())
 
 
 def closed_tasks():
     """Return closed tasks."""
-    return db.session.query(Task) \
-        .filter_by(status='0').order_by(Task.due_date.asc())
+    return db.reader().query(Task) \
+        .options(joinedload(Task.poster)) \
+        .filter_by(status='0') \
+        .order_by(Task.due_date.asc(), Task.task_id.asc())
+
+
+def task_page(query, prefix):
+    """Return the page of `query` selected by the `<prefix>_*` args."""
+    cursors = {}
+    for direction in ('after', 'before'):
+        cursor = request.args.get('{0}_{1}'.format(prefix, direction))
+        if cursor:
+            try:
+                cursors[direction] = decode_cursor(cursor)
+            except ValueError:
+                # a mangled cursor just means starting from the top
+                return paginate(query, per_page=per_page(prefix))
+    return paginate(query, per_page=per_page(prefix), **cursors)
+
+
+def per_page(prefix):
+    """Page size for the open or closed task list."""
+    return app.config['{0}_TASKS_PER_PAGE'.format(prefix.upper())]
+
+
+def page_url(prefix, **cursor):
+    """Dashboard url moving one list while keeping the other in place."""
+    args = request.args.to_dict()
+    args.pop(prefix + '_after', None)
+    args.pop(prefix + '_before', None)
+    for direction, value in cursor.items():
+        args['{0}_{1}'.format(prefix, direction)] = value
+    return url_for('tasks.tasks', **args)
+
+
+def wants_json():
+    """True when the client asked for json rather than a page."""
+    return request.accept_mimetypes.best_match(
+        ['text/html', 'application/json']) == 'application/json'
+
+
+def owned_task(task_id):
+    """Fetch the task row if the current user may change it.
+
+    Aborts with a 404 if there is no such task and returns None if it
+    belongs to someone else.
+    """
+    allowed, errors = check_ownership(
+        [task_id], session['user_id'], session['role'] == 'admin')
+    if errors.get(task_id) == 'not found':
+        abort(404)
+    return allowed[0] if allowed else None
+
+
+def event_stream(subscription):
+    """Yield server-sent events until the stream's time is up."""
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+    deadline = time.time() + app.config['EVENTS_MAX_SECONDS']
+    try:
+        yield 'retry: 5000\n\n'
+        while time.time() < deadline:
+            event = subscription.get(
+                max(0, min(heartbeat, deadline - time.time())))
+            if subscription.overflowed:
+                # too far behind to patch; have the page reload instead
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield format_event(event)
+    finally:
+        subscription.close()
+
+
+def can_edit(task):
+    """True when the viewer gets Complete/Delete links for `task`."""
+    return task.poster.name == session['name'] or session['role'] == 'admin'
+
+
+def row_key(task):
+    """Cache key for a task's row, for this viewer.
+
+    Every change to a task bumps its revision and updated_at, so a key
+    never outlives the row it was rendered from; the timestamp also
+    tells apart tasks that reuse an id after a database reset.
+    """
+    return 'row:{0}:{1}:{2}:{3}:{4}'.format(
+        task.task_id, task.revision, task.updated_at, int(can_edit(task)),
+        request.script_root)
+
+
+def render_row(task):
+    """Markup for one row of a dashboard task list."""
+    return app.jinja_env.get_template('_task_row.html').render(
+        task=task, editable=can_edit(task))
+
+
+def task_rows(tasks):
+    """Rendered rows for `tasks`, from the fragment cache where possible."""
+    tasks = list(tasks)
+    if not app.config['ROW_CACHE_ENABLED']:
+        return [Markup(render_row(task)) for task in tasks]
+    return cached_fragments(row_cache, tasks, row_key, render_row)
+
+
+def render_dashboard(form):
+    """Render tasks.html with the current page of each task list."""
+    open_page = task_page(open_tasks(), 'open')
+    closed_page = task_page(closed_tasks(), 'closed')
+    return render_template(
+        'tasks.html',
+        form=form,
+        open_tasks=open_page,
+        open_rows=task_rows(open_page),
+        closed_tasks=closed_page,
+        closed_rows=task_rows(closed_page),
+        counts=task_counts(session['user_id']),
+        page_url=page_url,
+    )
 
 
 # route handlers
 
 @tasks_blueprint.route('/tasks/')
 @login_required
+@cached_view(cache, per_user=True)
 def tasks():
     """Display open and closed tasks."""
+    return render_dashboard(AddTaskForm(request.form))
+
+
+@tasks_blueprint.route('/tasks/search/')
+@login_required
+@cached_view(cache, per_user=True)
+def search():
+    """Tasks whose names match the search box, best matches first."""
+    text = request.args.get('q', '')
+    try:
+        page = max(1, min(int(request.args.get('page', 1)),
+                          app.config['SEARCH_MAX_PAGES']))
+    except ValueError:
+        page = 1
+    results, has_next = [], False
+    if match_query(text):
+        query = db.reader().query(Task).options(joinedload(Task.poster))
+        results, has_next = search_page(
+            query, text, page, app.config['SEARCH_PER_PAGE'])
     return render_template(
-        'tasks.html',
-        form=AddTaskForm(request.form),
-        open_tasks=open_tasks(),
-        closed_tasks=closed_tasks(),
+        'search.html',
+        q=text,
+        results=results,
+        page=page,
+        has_next=has_next and page < app.config['SEARCH_MAX_PAGES'],
+    )
+
+
+@tasks_blueprint.route('/tasks/stream')
+@login_required
+def stream():
+    """Server-sent events for live dashboard updates."""
+    if not request.environ.get('wsgi.multithread'):
+        # one client would tie up a whole sync worker; 204 tells the
+        # browser not to reconnect, and the page just stays static
+        return Response(status=204)
+    try:
+        subscription = events.subscribe()
+    except TooManyStreams:
+        return Response(status=503, headers={'Retry-After': '30'})
+    return Response(
+        event_stream(subscription),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
 
@@ -80,31 +259,45 @@ def new_task():
             session['user_id']
         )
         db.session.add(new_task)
+        # the insert has to run before the task has an id to log
+        db.session.flush()
+        adjust_stats({session['user_id']: (1, 0)})
+        record_changes('create', [new_task.task_id])
         db.session.commit()
+        cache.bump_generation()
+        events.publish(task_event(
+            'created', new_task.task_id,
+            name=new_task.name,
+            due_date=str(new_task.due_date),
+            posted_date=str(new_task.posted_date),
+            priority=new_task.priority,
+            posted_by=session['name']
+        ))
+        if wants_json():
+            task = TaskSerializer().from_task(new_task)
+            task['posted by'] = session['name']
+            return json_response({'task': task}, 201)
         flash("{0} was successfully posted. Thanks.".format(new_task.name))
-    return render_template(
-        'tasks.html',
-        form=form,
-        open_tasks=open_tasks(),
-        closed_tasks=closed_tasks(),
-    )
+        # redirect so a refresh doesn't post the form again
+        return redirect(url_for('tasks.tasks'))
+    if wants_json():
+        return json_response({'errors': form.errors}, 400)
+    return render_dashboard(form)
 
 
 @tasks_blueprint.route('/delete/<int:task_id>/')
 @login_required
 def delete_task(task_id):
     """Delete a task by id."""
-    task = Task.query.filter_by(task_id=task_id)
-
-    if task.first().user_id == session['user_id'] \
-            or session['role'] == 'admin':
-        # have to store the task name for the flash before we delete it
-        task_name = task.first().name
-        task.delete()
-        db.session.commit()
-        flash("{0} was deleted. Nice".format(task_name))
-    else:
+    task = owned_task(task_id)
+    if task is None:
         flash("You can only delete tasks that belong to you.")
+    else:
+        delete_tasks([task])
+        db.session.commit()
+        cache.bump_generation()
+        events.publish(task_event('deleted', task.task_id))
+        flash("{0} was deleted. Nice".format(task.name))
     return redirect(url_for('tasks.tasks'))
 
 
@@ -112,14 +305,14 @@ def delete_task(task_id):
 @login_required
 def complete_task(task_id):
     """Complete a task by id."""
-    task = Task.query.filter_by(task_id=task_id)
-
-    if task.first().user_id == session['user_id'] \
-            or session['role'] == 'admin':
-        task.update({"status": "0"})
-        db.session.commit()
-        flash("{0} was completed. Nice".format(task.first().name))
-    else:
+    task = owned_task(task_id)
+    if task is None:
         flash("You can only update tasks that belong to you.")
-
+    else:
+        closed = complete_tasks([task])
+        db.session.commit()
+        cache.bump_generation()
+        for task_id in closed:
+            events.publish(task_event('completed', task_id))
+        flash("{0} was completed. Nice".format(task.name))
     return redirect(url_for('tasks.tasks'))
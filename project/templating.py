@@ -0,0 +1,41 @@
+"""Compiled template caching.
+
+Jinja turns each template into Python code the first time a process
+renders it, so every new worker or dyno pays to compile _base.html,
+tasks.html and the rest again.  With TEMPLATE_CACHE_DIR set the compiled
+code is kept on disk and shared instead; `python build.py` fills it at
+deploy time.  Entries are keyed on the template's source, so an edited
+template is simply compiled afresh.
+"""
+
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def make_bytecode_cache(config):
+    """FileSystemBytecodeCache in TEMPLATE_CACHE_DIR, or None if unset."""
+    directory = config.get('TEMPLATE_CACHE_DIR')
+    if not directory:
+        return None
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # another worker got there first, or the directory is read
+            # only; either way rendering works without the cache
+            if not os.path.isdir(directory):
+                return None
+    return FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app):
+    """Compile every template `app` can render; returns their names.
+
+    Fills the bytecode cache, and the Jinja environment's own cache, so
+    calling it before workers fork leaves them nothing to compile.
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
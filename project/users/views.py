@@ -3,7 +3,10 @@
 from functools import wraps
 from flask import (
     Blueprint,
+    Response,
     flash,
+    jsonify,
+    make_response,
     redirect,
     request,
     render_template,
@@ -14,7 +17,8 @@ from sqlalchemy.exc import IntegrityError
 
 # What does the . in .forms do?
 from .forms import RegisterForm, LoginForm
-from project import db, bcrypt
+from project import db, hasher, login_throttle
+from project.hashing import HasherBusy
 from project.models import User
 
 
@@ -39,6 +43,27 @@ def login_required(test):
     return wrap
 
 
+def hashing_busy(template, form):
+    """503 asking the user to retry when the password hasher is full."""
+    response = make_response(render_template(
+        template,
+        form=form,
+        error='We are very busy right now.  Please try again in a moment.'
+    ), 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def too_many_attempts(retry_after):
+    """Plain 429 for a throttled login, cheap enough to send to a flood."""
+    return Response(
+        'Too many failed logins.  Please try again later.\n',
+        status=429,
+        mimetype='text/plain',
+        headers={'Retry-After': str(int(retry_after) + 1)}
+    )
+
+
 # route handlers
 
 
@@ -61,11 +86,27 @@ def login():
     form = LoginForm(request.form)
 
     if request.method == 'POST':
+        name = request.form.get('name', '')
+        retry_after = login_throttle.retry_after(request.remote_addr, name)
+        if retry_after is not None:
+            return too_many_attempts(retry_after)
+
         if form.validate_on_submit():
             user = User.query.filter_by(name=form.name.data).first()
 
-            if user is not None and bcrypt.check_password_hash(
-                    user.password, form.password.data):
+            try:
+                valid = hasher.check_user(user, form.password.data)
+            except HasherBusy:
+                return hashing_busy('login.html', form)
+
+            if valid:
+                if hasher.needs_rehash(user.password):
+                    try:
+                        user.password = hasher.generate(form.password.data)
+                        db.session.commit()
+                    except HasherBusy:
+                        # the login still stands; rehash on a later one
+                        pass
                 session['logged_in'] = True
                 session['user_id'] = user.id
                 session['role'] = user.role
@@ -73,8 +114,10 @@ def login():
                 flash("Welcome, {0}".format(user.name))
                 return redirect(url_for('tasks.tasks'))
             else:
+                login_throttle.failed(request.remote_addr, name)
                 error = 'Invalid credentials.  Please try again.'
         else:
+            login_throttle.failed(request.remote_addr, name)
             error = 'Both fields are required.'
 
     return render_template(
@@ -90,10 +133,14 @@ def register():
     error = None
     form = RegisterForm(request.form)
     if form.validate_on_submit():
+        try:
+            password = hasher.generate(form.password.data)
+        except HasherBusy:
+            return hashing_busy('register.html', form)
         new_user = User(
             form.name.data,
             form.email.data,
-            bcrypt.generate_password_hash(form.password.data)
+            password
         )
         try:
             db.session.add(new_user)
@@ -108,3 +155,17 @@ def register():
         form=form,
         error=error
     )
+
+
+@users_blueprint.route('/login-stats/')
+@login_required
+def login_stats():
+    """Counters for the password hashing that throttling saved."""
+    if session.get('role') != 'admin':
+        return make_response(jsonify(error='Admins only'), 403)
+    return jsonify(
+        # every throttled post is one bcrypt comparison not run
+        hashes_avoided=login_throttle.rejected,
+        unknown_user_checks=hasher.dummy_checks,
+        hasher_busy=hasher.rejected
+    )
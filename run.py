@@ -1,7 +1,12 @@
-"""Launches the app."""
+"""Launches the development server.
+
+Production traffic goes through gunicorn instead; see gunicorn_config.py.
+"""
 
 import os
-from project import app
+from project import create_app
 
-port = int(os.environ.get('PORT', 5000))
-app.run(host='0.0.0.0', port=port)
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    app = create_app()
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -1,14 +1,45 @@
 """Flasktaskr api tests."""
 
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
-from datetime import date
+from datetime import date, timedelta
 
-from project import app, db
+from project import create_app, cache, db, bcrypt, events
 from project._config import basedir
-from project.models import Task
+from project import search as search_module
+from project.models import Task, TaskChange, User
+from project.tasks.operations import (
+    compact_changes,
+    recount_stats,
+    task_counts,
+)
 
+app = create_app()
 TEST_DB = 'test.db'
+TEST_READ_DB = 'test_read.db'
+
+# what db_create.py does, then a search, in a process that never calls
+# create_app(); prints the ids found
+SCHEMA_ONLY_SEARCH = """
+import sys
+from datetime import date
+from project import app, db
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + sys.argv[1]
+from project.models import Task
+db.create_all()
+db.session.add(Task('Bank the cheque', date(2016, 1, 1), 1,
+                    date(2016, 1, 1), 1, None))
+db.session.commit()
+assert 'project.tasks.views' not in sys.modules
+from project.search import has_fts5, search
+assert db.engine.has_table('tasks_fts') == has_fts5()
+print([task.task_id for task in search(Task.query, 'chequ')])
+"""
 
 
 class APITests(unittest.TestCase):
@@ -25,6 +56,7 @@ class APITests(unittest.TestCase):
             os.path.join(basedir, TEST_DB)
         self.app = app.test_client()
         db.create_all()
+        cache.clear()
 
         # Make sure we are testing in production mode
 
@@ -63,6 +95,28 @@ class APITests(unittest.TestCase):
         )
         db.session.commit()
 
+    def login_as(self, name, role='user'):
+        """Create a user directly and log in as them."""
+        db.session.add(User(
+            name=name,
+            email=name + '@example.com',
+            password=bcrypt.generate_password_hash(name),
+            role=role
+        ))
+        db.session.commit()
+        self.app.post(
+            '/', data=dict(name=name, password=name), follow_redirects=True)
+
+    def post_batch(self, *operations):
+        """Post operations to the batch endpoint, returning the results."""
+        response = self.app.post(
+            'api/v1/tasks/batch',
+            data=json.dumps({'operations': operations}),
+            content_type='application/json'
+        )
+        self.assertEquals(response.status_code, 200)
+        return json.loads(response.data.decode())['results']
+
     # Tests
 
     def test_collection_endpoint_returns_correct_data(self):
@@ -91,5 +145,517 @@ class APITests(unittest.TestCase):
         self.assertEquals(response.mimetype, 'application/json')
         self.assertIn(b'Element does not exist', response.data)
 
+    def test_resource_endpoint_answers_conditional_requests(self):
+        """Resource endpoint 304s while the client's version is current."""
+        self.add_tasks()
+        response = self.app.get('api/v1/tasks/1')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        response = self.app.get(
+            'api/v1/tasks/1', headers={'If-None-Match': etag})
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.data, b'')
+        response = self.app.get(
+            'api/v1/tasks/1', headers={'If-Modified-Since': last_modified})
+        self.assertEquals(response.status_code, 304)
+
+        self.login_as('tonyhat', role='admin')
+        self.post_batch({'op': 'complete', 'task_id': 1})
+        response = self.app.get(
+            'api/v1/tasks/1', headers={'If-None-Match': etag})
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_changes_when_a_task_id_is_reused(self):
+        """A new task with a deleted task's id doesn't match its ETag."""
+        self.add_tasks()
+        etag = self.app.get('api/v1/tasks/2').headers['ETag']
+        self.login_as('tonyhat', role='admin')
+        self.post_batch({'op': 'delete', 'task_id': 2})
+        results = self.post_batch({'op': 'create', 'name': 'Reused id',
+                                   'due_date': '2016-10-22', 'priority': 1})
+        self.assertEqual(results[0]['task_id'], 2)
+        response = self.app.get(
+            'api/v1/tasks/2', headers={'If-None-Match': etag})
+        self.assertEquals(response.status_code, 200)
+        self.assertIn(b'Reused id', response.data)
+
+    def test_collection_endpoint_pages_with_cursor(self):
+        """Collection endpoint pages through tasks with limit/after."""
+        self.add_tasks()
+        response = self.app.get('api/v1/tasks/?limit=1')
+        data = json.loads(response.data.decode())
+        self.assertEqual([t['task_id'] for t in data['items']], [1])
+        self.assertIn('after=1', data['next'])
+        response = self.app.get(data['next'])
+        data = json.loads(response.data.decode())
+        self.assertEqual([t['task_id'] for t in data['items']], [2])
+        self.assertNotIn('next', data)
+
+    def test_collection_endpoint_filters(self):
+        """Collection endpoint filters on priority and due date."""
+        self.add_tasks()
+        response = self.app.get('api/v1/tasks/?priority=8')
+        self.assertNotIn(b'Test task 1.', response.data)
+        self.assertIn(b'A totally different thing.', response.data)
+        response = self.app.get(
+            'api/v1/tasks/?due_from=2016-10-01&due_to=2016-10-31&status=1'
+        )
+        self.assertIn(b'Test task 1.', response.data)
+        self.assertNotIn(b'A totally different thing.', response.data)
+
+    def test_collection_endpoint_returns_only_requested_fields(self):
+        """Collection endpoint honours fields=."""
+        self.add_tasks()
+        response = self.app.get('api/v1/tasks/?fields=name,priority')
+        data = json.loads(response.data.decode())
+        self.assertEqual(
+            data['items'][0],
+            {'task name': 'Test task 1.', 'priority': 10}
+        )
+
+    def test_collection_endpoint_rejects_bad_arguments(self):
+        """Collection endpoint returns 400 on bad arguments."""
+        for query in ('limit=0', 'limit=abc', 'fields=colour',
+                      'due_from=yesterday'):
+            response = self.app.get('api/v1/tasks/?' + query)
+            self.assertEquals(response.status_code, 400)
+            self.assertEquals(response.mimetype, 'application/json')
+
+    def test_collection_endpoint_revalidates_until_batch_write(self):
+        """Collection endpoint 304s until a batch changes the tasks."""
+        self.add_tasks()
+        self.login_as('tonyhat')
+        etag = self.app.get('api/v1/tasks/').headers['ETag']
+        response = self.app.get(
+            'api/v1/tasks/', headers={'If-None-Match': etag})
+        self.assertEquals(response.status_code, 304)
+        self.post_batch({'op': 'complete', 'task_id': 1})
+        response = self.app.get(
+            'api/v1/tasks/', headers={'If-None-Match': etag})
+        self.assertEquals(response.status_code, 200)
+
+    def test_export_streams_ndjson(self):
+        """Export endpoint streams one json document per task."""
+        self.add_tasks()
+        response = self.app.get('api/v1/tasks/export')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['task name'],
+                         'A totally different thing.')
+
+    def test_export_streams_csv(self):
+        """Export endpoint streams csv with a header row."""
+        self.add_tasks()
+        response = self.app.get(
+            'api/v1/tasks/export?format=csv&fields=task_id,name&priority=10'
+        )
+        self.assertEquals(response.mimetype, 'text/csv')
+        self.assertEqual(
+            response.data.decode().splitlines(),
+            ['task_id,name', '1,Test task 1.']
+        )
+
+    def test_export_rejects_unknown_format(self):
+        """Export endpoint returns 400 for unknown formats."""
+        response = self.app.get('api/v1/tasks/export?format=xml')
+        self.assertEquals(response.status_code, 400)
+
+    def test_batch_applies_operations_and_reports_each(self):
+        """Batch endpoint applies valid operations and reports every one."""
+        self.add_tasks()
+        self.login_as('tonyhat')
+        results = self.post_batch(
+            {'op': 'create', 'name': 'New', 'due_date': '2016-11-01',
+             'priority': 3},
+            {'op': 'complete', 'task_id': 1},
+            {'op': 'delete', 'task_id': 2},
+            {'op': 'delete', 'task_id': 99},
+            {'op': 'create', 'name': 'Bad', 'due_date': 'soon',
+             'priority': 3},
+            {'op': 'rename', 'task_id': 1},
+        )
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['ok', 'ok', 'ok', 'error', 'error', 'error']
+        )
+        self.assertEqual(results[0]['task_id'], 3)
+        self.assertEqual(results[3]['error'], 'not found')
+        db.session.expire_all()
+        self.assertEqual(Task.query.get(1).status, 0)
+        self.assertIsNone(Task.query.get(2))
+        self.assertEqual(Task.query.get(3).name, 'New')
+        self.assertEqual(Task.query.count(), 2)
+
+    def test_batch_reports_the_ids_the_database_assigned(self):
+        """Created ids, and their change log entries, match the rows."""
+        self.add_tasks()
+        self.login_as('tonyhat')
+        results = self.post_batch(*[
+            {'op': 'create', 'name': 'New {0}'.format(i),
+             'due_date': '2016-11-01', 'priority': 3}
+            for i in range(2)
+        ])
+        for i, result in enumerate(results):
+            self.assertEqual(Task.query.get(result['task_id']).name,
+                             'New {0}'.format(i))
+        logged = [task_id for task_id, in db.session.query(
+            TaskChange.task_id).filter_by(op='create')]
+        self.assertEqual(logged, [r['task_id'] for r in results])
+
+    def test_batch_applies_repeated_ids_once(self):
+        """The same task twice in a batch is changed and logged once."""
+        self.add_tasks()
+        self.login_as('tonyhat')
+        results = self.post_batch({'op': 'complete', 'task_id': 1},
+                                  {'op': 'complete', 'task_id': 1})
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok'])
+        self.assertEqual(TaskChange.query.filter_by(task_id=1).count(), 1)
+        self.assertEqual(Task.query.get(1).revision, 2)
+
+    def test_batch_keeps_counters_right_with_repeated_ops(self):
+        """Repeated and mixed ops on one task count it once."""
+        self.add_tasks()
+        recount_stats()
+        db.session.commit()
+        self.login_as('tonyhat')
+        self.post_batch({'op': 'complete', 'task_id': 1},
+                        {'op': 'complete', 'task_id': 1})
+        self.assertEqual(task_counts(), {'open': 1, 'closed': 1})
+        self.post_batch({'op': 'complete', 'task_id': 2},
+                        {'op': 'delete', 'task_id': 2})
+        self.assertEqual(task_counts(), {'open': 0, 'closed': 1})
+        self.post_batch({'op': 'complete', 'task_id': 1})
+        self.assertEqual(task_counts(), {'open': 0, 'closed': 1})
+
+    def test_completing_a_closed_task_logs_and_publishes_nothing(self):
+        """Only tasks a request actually closes reach the log and streams."""
+        self.add_tasks()
+        self.login_as('tonyhat')
+        self.post_batch({'op': 'complete', 'task_id': 1})
+        changes = TaskChange.query.count()
+        subscription = events.subscribe()
+        try:
+            results = self.post_batch({'op': 'complete', 'task_id': 1},
+                                      {'op': 'complete', 'task_id': 2})
+            self.assertEqual([r['status'] for r in results], ['ok', 'ok'])
+            self.app.get('complete/1/')
+            self.assertEqual(TaskChange.query.count(), changes + 1)
+            completed = subscription.get(timeout=1)
+            self.assertEqual(completed['task']['task_id'], 2)
+            self.assertIsNone(subscription.get(timeout=0.1))
+        finally:
+            subscription.close()
+
+    def test_batch_checks_ownership(self):
+        """Batch endpoint refuses changes to other users' tasks."""
+        self.add_tasks()
+        self.login_as('joshua')
+        self.login_as('tonyhat')
+        results = self.post_batch({'op': 'delete', 'task_id': 1})
+        self.assertEqual(results[0]['error'], 'forbidden')
+        self.assertIsNotNone(Task.query.get(1))
+
+    def test_batch_lets_admins_change_any_task(self):
+        """Batch endpoint lets admins change any task."""
+        self.add_tasks()
+        self.login_as('joshua')
+        self.login_as('adminuser', role='admin')
+        results = self.post_batch({'op': 'delete', 'task_id': 1})
+        self.assertEqual(results[0]['status'], 'ok')
+
+    def test_search_matches_word_prefixes(self):
+        """Search matches every word as a prefix, best match first."""
+        self.add_tasks()
+        db.session.add(Task("Bank the totally different cheque",
+                            date(2016, 1, 1), 1, date(2016, 1, 1), 1, 1))
+        db.session.commit()
+        response = self.app.get('api/v1/tasks/search?q=totall+diff')
+        self.assertEquals(response.status_code, 200)
+        items = json.loads(response.data.decode())['items']
+        self.assertEquals([item['task_id'] for item in items], [2, 3])
+        response = self.app.get('api/v1/tasks/search?q=bank')
+        items = json.loads(response.data.decode())['items']
+        self.assertEquals([item['task_id'] for item in items], [3])
+
+    def test_search_falls_back_without_fts5(self):
+        """Without FTS5 the tables still build and search scans names."""
+        db.drop_all()
+        search_module._fts5[:] = [False]
+        try:
+            db.create_all()
+            self.add_tasks()
+            response = self.app.get('api/v1/tasks/search?q=totall+diff')
+            self.assertEquals(response.status_code, 200)
+            items = json.loads(response.data.decode())['items']
+            self.assertEquals([item['task_id'] for item in items], [2])
+        finally:
+            db.drop_all()
+            del search_module._fts5[:]
+            db.create_all()
+
+    def test_search_index_is_built_without_create_app(self):
+        """Schema built from the models alone still has the search index."""
+        directory = tempfile.mkdtemp()
+        try:
+            output = subprocess.check_output(
+                [sys.executable, '-c', SCHEMA_ONLY_SEARCH,
+                 os.path.join(directory, 'schema.db')],
+                cwd=os.path.dirname(basedir))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEquals(output.decode().strip(), '[1]')
+
+    def test_search_pages_and_filters(self):
+        """Search results page with ?page= and take the usual filters."""
+        self.add_tasks()
+        for name, priority in (('Report one', 1), ('Report two', 8)):
+            db.session.add(Task(name, date(2016, 1, 1), priority,
+                                date(2016, 1, 1), 1, 1))
+        db.session.commit()
+        response = self.app.get('api/v1/tasks/search?q=rep&limit=1')
+        data = json.loads(response.data.decode())
+        self.assertEquals(len(data['items']), 1)
+        self.assertIn('page=2', data['next'])
+        response = self.app.get(data['next'])
+        data = json.loads(response.data.decode())
+        self.assertEquals(len(data['items']), 1)
+        self.assertNotIn('next', data)
+        response = self.app.get('api/v1/tasks/search?q=rep&priority=8')
+        data = json.loads(response.data.decode())
+        self.assertEquals([item['task_id'] for item in data['items']], [4])
+        # one and two letter words only match whole words
+        response = self.app.get('api/v1/tasks/search?q=re')
+        self.assertEquals(json.loads(response.data.decode())['items'], [])
+
+    def test_search_follows_deletes_and_renames(self):
+        """The index stays in step with the tasks table."""
+        self.add_tasks()
+        task = Task.query.get(1)
+        task.name = 'Renamed errand'
+        db.session.commit()
+        db.session.delete(Task.query.get(2))
+        db.session.commit()
+        cache.clear()
+        response = self.app.get('api/v1/tasks/search?q=errand')
+        self.assertIn(b'Renamed errand', response.data)
+        for q in ('test', 'different'):
+            response = self.app.get('api/v1/tasks/search?q=' + q)
+            self.assertEquals(
+                json.loads(response.data.decode())['items'], [])
+
+    def test_search_rejects_empty_query(self):
+        """Search without any words is a 400."""
+        response = self.app.get('api/v1/tasks/search?q=%22*')
+        self.assertEquals(response.status_code, 400)
+
+    def get_changes(self, since, **args):
+        """Fetch the change feed, returning (status, json)."""
+        args['since'] = since
+        query = '&'.join('{0}={1}'.format(k, v) for k, v in args.items())
+        response = self.app.get('api/v1/tasks/changes?' + query)
+        return response.status_code, json.loads(response.data.decode())
+
+    def test_changes_feed_returns_only_deltas(self):
+        """The change feed sends each changed task once, with tombstones."""
+        self.login_as('tonyhat')
+        self.post_batch(*[
+            {'op': 'create', 'name': 'Task {0}'.format(i),
+             'due_date': '2016-10-22', 'priority': 1}
+            for i in range(3)
+        ])
+        status, feed = self.get_changes(0)
+        self.assertEquals(status, 200)
+        self.assertEquals(
+            [change['task']['task_id'] for change in feed['changes']],
+            [1, 2, 3])
+        since = feed['since']
+
+        self.post_batch({'op': 'complete', 'task_id': 1},
+                        {'op': 'delete', 'task_id': 2})
+        self.post_batch({'op': 'delete', 'task_id': 1})
+        status, feed = self.get_changes(since)
+        self.assertEquals(feed['changes'], [
+            {'seq': feed['changes'][0]['seq'], 'op': 'delete',
+             'task_id': 2},
+            {'seq': feed['since'], 'op': 'delete', 'task_id': 1},
+        ])
+        status, feed = self.get_changes(feed['since'])
+        self.assertEquals(feed['changes'], [])
+        self.assertFalse(feed['more'])
+
+    def test_changes_feed_pages(self):
+        """The change feed pages with limit and reports more."""
+        self.login_as('tonyhat')
+        self.post_batch(*[
+            {'op': 'create', 'name': 'Task', 'due_date': '2016-10-22',
+             'priority': 1}
+            for i in range(3)
+        ])
+        status, feed = self.get_changes(0, limit=2)
+        self.assertEquals(len(feed['changes']), 2)
+        self.assertTrue(feed['more'])
+        status, feed = self.get_changes(feed['since'], limit=2)
+        self.assertEquals(len(feed['changes']), 1)
+        self.assertFalse(feed['more'])
+        status, feed = self.get_changes('soon')
+        self.assertEquals(status, 400)
+
+    def test_compaction_keeps_latest_and_expires_tombstones(self):
+        """Compaction is lossless until tombstones expire, then 410s."""
+        self.login_as('tonyhat')
+        self.post_batch(*[
+            {'op': 'create', 'name': 'Task', 'due_date': '2016-10-22',
+             'priority': 1}
+            for i in range(2)
+        ])
+        self.post_batch({'op': 'complete', 'task_id': 1},
+                        {'op': 'delete', 'task_id': 2})
+        _, before = self.get_changes(0)
+
+        self.assertEquals(compact_changes(timedelta(days=30)), 2)
+        db.session.commit()
+        cache.clear()
+        _, after = self.get_changes(0)
+        self.assertEquals(after, before)
+
+        self.assertEquals(compact_changes(timedelta(0)), 1)
+        db.session.commit()
+        cache.clear()
+        self.assertEquals(TaskChange.query.count(), 1)
+        status, feed = self.get_changes(0)
+        self.assertEquals(status, 410)
+        status, feed = self.get_changes(feed['since'])
+        self.assertEquals((status, feed['changes']), (200, []))
+
+    def test_stats_endpoint_follows_task_changes(self):
+        """Stats endpoint reflects creates, completes and deletes."""
+        response = self.app.get('api/v1/stats')
+        self.assertEquals(
+            json.loads(response.data.decode()), {'open': 0, 'closed': 0})
+        self.login_as('tonyhat')
+        self.post_batch(*[
+            {'op': 'create', 'name': 'Task', 'due_date': '2016-10-22',
+             'priority': 1}
+            for _ in range(3)
+        ])
+        self.post_batch({'op': 'complete', 'task_id': 1},
+                        {'op': 'delete', 'task_id': 2})
+        response = self.app.get('api/v1/stats')
+        self.assertEquals(json.loads(response.data.decode()), {
+            'open': 1, 'closed': 1, 'user': {'open': 1, 'closed': 1}})
+
+    def test_missing_counters_are_recounted(self):
+        """Tasks added behind the app's back are counted."""
+        self.add_tasks()
+        self.login_as('adminuser', role='admin')
+        self.post_batch({'op': 'complete', 'task_id': 1})
+        response = self.app.get('api/v1/stats')
+        stats = json.loads(response.data.decode())
+        self.assertEquals((stats['open'], stats['closed']), (1, 1))
+        db.session.execute(Task.__table__.insert(), dict(
+            name='Sneaky', due_date=date(2016, 1, 1), priority=1,
+            posted_date=date(2016, 1, 1), status=1, user_id=1))
+        self.assertEquals(recount_stats(), 2)
+        db.session.commit()
+        response = self.app.get('api/v1/stats')
+        stats = json.loads(response.data.decode())
+        self.assertEquals((stats['open'], stats['closed']), (2, 1))
+
+    def test_batch_rejects_malformed_payload(self):
+        """Batch endpoint returns 400 without an operations list."""
+        self.login_as('tonyhat')
+        response = self.app.post(
+            'api/v1/tasks/batch',
+            data='{"create": []}',
+            content_type='application/json'
+        )
+        self.assertEquals(response.status_code, 400)
+
+
+class ReadReplicaTests(unittest.TestCase):
+    """Reads routed to SQLALCHEMY_READ_DATABASE_URI."""
+
+    def setUp(self):
+        """Set up."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['DEBUG'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
+            os.path.join(basedir, TEST_DB)
+        app.config['SQLALCHEMY_READ_DATABASE_URI'] = 'sqlite:///' + \
+            os.path.join(basedir, TEST_READ_DB)
+        self.app = app.test_client()
+        db.create_all()
+        db.metadata.create_all(bind=db.read_engine())
+        cache.clear()
+
+    def tearDown(self):
+        """Tear down."""
+        db.session.remove()
+        db.read_session.remove()
+        db.drop_all()
+        db.metadata.drop_all(bind=db.read_engine())
+        db.read_engine().dispose()
+        app.config['SQLALCHEMY_READ_DATABASE_URI'] = None
+        # nothing else uses the replica file, so don't leave it behind
+        for suffix in ('', '-wal', '-shm'):
+            path = os.path.join(basedir, TEST_READ_DB) + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    def add_task(self, engine, name):
+        engine.execute(Task.__table__.insert(), dict(
+            name=name, due_date=date(2016, 10, 22), priority=1,
+            posted_date=date(2016, 9, 12), status=1, user_id=1))
+
+    def test_api_reads_come_from_the_read_database(self):
+        """Api reads use the read database."""
+        self.add_task(db.engine, 'Only on the primary')
+        self.add_task(db.read_engine(), 'Only on the replica')
+        response = self.app.get('api/v1/tasks/')
+        self.assertIn(b'Only on the replica', response.data)
+        self.assertNotIn(b'Only on the primary', response.data)
+        response = self.app.get('api/v1/tasks/1')
+        self.assertIn(b'Only on the replica', response.data)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        """A user who just wrote reads from the primary."""
+        db.session.add(User('writer', 'writer@example.com',
+                            bcrypt.generate_password_hash('writer')))
+        db.session.commit()
+        self.app.post('/', data=dict(name='writer', password='writer'),
+                      follow_redirects=True)
+        response = self.app.post(
+            'add/',
+            data=dict(name='Just written', due_date='10/22/2016',
+                      priority='1'),
+            headers={'Accept': 'application/json'}
+        )
+        self.assertEquals(response.status_code, 201)
+        response = self.app.get('api/v1/tasks/')
+        self.assertIn(b'Just written', response.data)
+
+    def test_replica_reads_are_not_cached_for_the_writer(self):
+        """Another user's lagging replica read isn't served to the writer."""
+        db.session.add(User('writer', 'writer@example.com',
+                            bcrypt.generate_password_hash('writer')))
+        db.session.commit()
+        writer = self.app
+        writer.post('/', data=dict(name='writer', password='writer'),
+                    follow_redirects=True)
+        writer.post('add/', data=dict(name='Just written',
+                                      due_date='10/22/2016', priority='1'))
+        # the replica hasn't seen the write yet
+        reader = app.test_client()
+        response = reader.get('api/v1/tasks/')
+        self.assertNotIn(b'Just written', response.data)
+        self.assertNotIn('ETag', response.headers)
+        response = writer.get('api/v1/tasks/')
+        self.assertIn(b'Just written', response.data)
+
 if __name__ == "__main__":
     unittest.main()
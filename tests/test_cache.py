@@ -0,0 +1,95 @@
+"""Response cache backend tests."""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from project.cache import FileCache, LRUCache, cached_fragments
+
+
+class CacheTests(object):
+    """Tests every backend has to pass."""
+
+    def test_get_returns_what_was_set(self):
+        """Values round trip."""
+        self.cache.set('key', (b'body', 'text/html'))
+        self.assertEqual(self.cache.get('key'), (b'body', 'text/html'))
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_entries_expire(self):
+        """Entries past their timeout are gone."""
+        self.cache.set('key', 'value', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_bump_generation_changes_token(self):
+        """Bumping the generation hands out a new token."""
+        before = self.cache.generation()
+        self.assertEqual(self.cache.generation(), before)
+        self.cache.bump_generation()
+        self.assertNotEqual(self.cache.generation(), before)
+
+    def test_many_round_trips(self):
+        """Batched gets and sets match single ones."""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'missing', 'b']),
+                         [1, None, 2])
+
+    def test_fragments_render_only_what_is_missing(self):
+        """Cached fragments are reused; only new keys are rendered."""
+        rendered = []
+
+        def render(item):
+            rendered.append(item)
+            return '<li>{0}</li>'.format(item)
+
+        first = cached_fragments(self.cache, [1], str, render)
+        second = cached_fragments(self.cache, [1, 2], str, render)
+        self.assertEqual(rendered, [1, 2])
+        self.assertEqual(second, ['<li>1</li>', '<li>2</li>'])
+        self.assertEqual(first[0].__html__(), '<li>1</li>')
+
+    def test_clear_empties_cache(self):
+        """Clear drops every entry."""
+        self.cache.set('key', 'value')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+
+class LRUCacheTests(CacheTests, unittest.TestCase):
+    """In-process LRU backend."""
+
+    def setUp(self):
+        self.cache = LRUCache(threshold=2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """The entry used longest ago goes first."""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+
+
+class FileCacheTests(CacheTests, unittest.TestCase):
+    """Shared file backend."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = FileCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_generation_is_shared_between_instances(self):
+        """Another worker's cache sees a bumped generation."""
+        other = FileCache(self.cache_dir)
+        self.cache.bump_generation()
+        self.assertEqual(other.generation(), self.cache.generation())
+        other.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Background error log tests."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from project.errorlog import ErrorLog
+
+
+class ErrorLogTests(unittest.TestCase):
+    """Test Class."""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.log_dir, 'error.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def read_lines(self, path=None):
+        with open(path or self.path) as f:
+            return f.read().splitlines()
+
+    def test_records_are_written_by_background_thread(self):
+        """Logged errors end up in the file after a flush."""
+        log = ErrorLog(self.path)
+        log.log(404, 'http://localhost/nope')
+        log.log(500, 'http://localhost/boom')
+        log.flush()
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('404 error at '))
+        self.assertTrue(lines[1].endswith(':http://localhost/boom'))
+
+    def test_json_lines_carry_route_and_timing(self):
+        """JSON mode writes one object per line with the extra fields."""
+        log = ErrorLog(self.path, json_lines=True)
+        log.log(404, 'http://localhost/nope', route=None, duration_ms=1.5)
+        log.flush()
+        record = json.loads(self.read_lines()[0])
+        self.assertEqual(record['status'], 404)
+        self.assertEqual(record['duration_ms'], 1.5)
+        self.assertIn('route', record)
+
+    def test_repeated_errors_are_sampled(self):
+        """Repeats past the limit are dropped and counted."""
+        log = ErrorLog(self.path, sample_limit=2, sample_window=0.05)
+        for _ in range(5):
+            log.log(404, 'http://localhost/nope')
+        log.log(404, 'http://localhost/other')
+        log.flush()
+        self.assertEqual(len(self.read_lines()), 3)
+
+        time.sleep(0.06)
+        log.log(404, 'http://localhost/nope')
+        log.flush()
+        self.assertIn('(+3 similar suppressed)', self.read_lines()[-1])
+
+    def test_sampling_state_stays_bounded(self):
+        """Unique urls don't grow the sampling state without limit."""
+        log = ErrorLog(self.path, sample_window=0.05, max_samples=10)
+        for i in range(50):
+            log.log(404, 'http://localhost/{0}'.format(i))
+        self.assertEqual(len(log._samples), 10)
+        time.sleep(0.06)
+        log.log(404, 'http://localhost/last')
+        log.flush()
+        self.assertEqual(len(log._samples), 1)
+
+    def test_log_rotates_by_size(self):
+        """The log rolls over to numbered backups once it is too big."""
+        log = ErrorLog(self.path, max_bytes=100, backup_count=2,
+                       sample_limit=100)
+        for i in range(10):
+            log.log(404, 'http://localhost/{0}'.format(i))
+            log.flush()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertTrue(os.path.exists(self.path + '.2'))
+        self.assertFalse(os.path.exists(self.path + '.3'))
+        self.assertLessEqual(os.path.getsize(self.path), 100)
+
+    def test_workers_sharing_a_log_follow_its_rotations(self):
+        """Logs in two processes rotate the shared file by its real size."""
+        first = ErrorLog(self.path, max_bytes=100, backup_count=10)
+        second = ErrorLog(self.path, max_bytes=100, backup_count=10)
+        line = 'x' * 29 + '\n'
+        for i in range(12):
+            (first, second)[i % 2]._write(line)
+        paths = [self.path] + [
+            '{0}.{1}'.format(self.path, i) for i in range(1, 4)]
+        self.assertFalse(os.path.exists(self.path + '.4'))
+        for path in paths:
+            self.assertEqual(len(self.read_lines(path)), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests for the per-request instrumentation."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy.exc import OperationalError
+
+from project import bcrypt, create_app, db
+from project._config import basedir
+from project.errorlog import ErrorLog
+from project.instrumentation import TimedTemplate
+from project.models import User
+
+app = create_app()
+instrumentation = app.extensions['instrumentation']
+TEST_DB = 'test.db'
+
+
+class InstrumentationTests(unittest.TestCase):
+    """Test Class."""
+
+    def setUp(self):
+        """Set up."""
+        self.log_dir = tempfile.mkdtemp()
+        self.slow_log = instrumentation.slow_log
+        instrumentation.slow_log = ErrorLog(
+            os.path.join(self.log_dir, 'slow.log'), json_lines=True)
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['DEBUG'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
+            os.path.join(basedir, TEST_DB)
+        self.app = app.test_client()
+        db.create_all()
+        instrumentation.install()
+
+    def tearDown(self):
+        """Tear down."""
+        instrumentation.uninstall()
+        instrumentation.slow_log = self.slow_log
+        shutil.rmtree(self.log_dir)
+        db.session.remove()
+        db.drop_all()
+
+    def login_as(self, role):
+        """Create a user with `role` and log in as them."""
+        db.session.add(User('admin', 'admin@example.com',
+                            bcrypt.generate_password_hash('python'), role))
+        db.session.commit()
+        return self.app.post('/', data=dict(name='admin', password='python'),
+                             follow_redirects=True)
+
+    def test_server_timing_header(self):
+        """Responses carry a Server-Timing header."""
+        response = self.login_as('user')
+        timing = response.headers['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertNotIn('"0 queries"', timing)
+
+    def test_bcrypt_time_is_recorded(self):
+        """Time spent in bcrypt shows up in the header."""
+        db.session.add(User('admin', 'admin@example.com',
+                            bcrypt.generate_password_hash('python'), 'user'))
+        db.session.commit()
+        response = self.app.post(
+            '/', data=dict(name='admin', password='python'))
+        self.assertNotIn('bcrypt;dur=0.00', response.headers['Server-Timing'])
+
+    def test_stats_are_admin_only(self):
+        """Non-admins get a 403 from the stats page."""
+        self.login_as('user')
+        response = self.app.get(app.config['INSTRUMENTATION_PATH'])
+        self.assertEqual(response.status_code, 403)
+
+    def test_stats_per_route(self):
+        """The stats page summarizes each route."""
+        self.login_as('admin')
+        self.app.get('/tasks/')
+        response = self.app.get(app.config['INSTRUMENTATION_PATH'])
+        self.assertEqual(response.status_code, 200)
+        routes = json.loads(response.data.decode('utf-8'))['routes']
+        self.assertIn('/tasks/', routes)
+        self.assertGreaterEqual(routes['/tasks/']['requests'], 1)
+        self.assertIn('le_inf', routes['/tasks/']['histogram'])
+
+    def test_slow_requests_are_logged(self):
+        """Requests over the threshold go to the slow log."""
+        app.config['INSTRUMENTATION_SLOW_MS'] = 0
+        try:
+            self.app.get('/slow-missing-route')
+        finally:
+            app.config['INSTRUMENTATION_SLOW_MS'] = 500
+        instrumentation.slow_log.flush()
+        with open(instrumentation.slow_log.path) as f:
+            lines = [json.loads(line) for line in f]
+        record = [r for r in lines if r['url'].endswith('/slow-missing-route')]
+        self.assertEqual(record[-1]['status'], 404)
+        self.assertIn('queries', record[-1])
+
+    def test_uninstall_removes_header(self):
+        """Uninstalling stops adding the header."""
+        instrumentation.uninstall()
+        response = self.app.get('/')
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_uninstall_restores_template_class(self):
+        """Templates render with the original class once uninstalled."""
+        self.app.get('/')
+        template = app.jinja_env.get_template('login.html')
+        self.assertIsInstance(template, TimedTemplate)
+        instrumentation.uninstall()
+        template = app.jinja_env.get_template('login.html')
+        self.assertNotIsInstance(template, TimedTemplate)
+
+    def test_failed_queries_do_not_leak_start_times(self):
+        """A statement that errors doesn't leave its start time behind."""
+        connection = db.engine.connect()
+        try:
+            with self.assertRaises(OperationalError):
+                connection.execute('SELECT * FROM no_such_table')
+            self.assertEqual(connection.info.get('query_started'), [])
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,16 @@
 import os
+import shutil
+import tempfile
 import unittest
 
-from project import app, db
+import project
+from project import create_app, db
 from project._config import basedir
+from project.errorlog import make_error_log
 from project.models import User
+from project.templating import make_bytecode_cache, precompile_templates
 
+app = create_app()
 TEST_DB = 'test.db'
 
 
@@ -20,6 +26,11 @@ class MainTests(unittest.TestCase):
         app.config['DEBUG'] = False
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
             os.path.join(basedir, TEST_DB)
+        self.log_dir = tempfile.mkdtemp()
+        self.error_log = project.error_log
+        project.error_log = make_error_log(dict(
+            app.config,
+            ERROR_LOG_PATH=os.path.join(self.log_dir, 'error.log')))
         self.app = app.test_client()
         db.create_all()
 
@@ -31,6 +42,9 @@ class MainTests(unittest.TestCase):
         """Tear down."""
         db.session.remove()
         db.drop_all()
+        project.error_log.flush()
+        project.error_log = self.error_log
+        shutil.rmtree(self.log_dir)
 
     # helper methods
 
@@ -55,6 +69,43 @@ class MainTests(unittest.TestCase):
         self.assertEquals(response.status_code, 404)
         self.assertIn(b'Sorry, there\'s nothing here.', response.data)
 
+    def test_404_error_is_logged(self):
+        """404s are written to the error log."""
+        self.app.get('/logged-missing-route')
+        project.error_log.flush()
+        with open(project.error_log.path) as f:
+            self.assertIn('/logged-missing-route', f.read())
+
+    def test_sqlite_connections_use_the_profile(self):
+        """Pooled connections get the SQLITE_PRAGMAS."""
+        self.assertEqual(db.engine.pool.__class__.__name__, 'QueuePool')
+        mode = db.session.execute('PRAGMA journal_mode').scalar()
+        self.assertEqual(mode, 'wal')
+        timeout = db.session.execute('PRAGMA busy_timeout').scalar()
+        self.assertEqual(timeout, 5000)
+
+    def test_templates_compile_into_the_bytecode_cache(self):
+        """Every template's compiled code lands in TEMPLATE_CACHE_DIR."""
+        directory = tempfile.mkdtemp()
+        bytecode_cache = app.jinja_env.bytecode_cache
+        app.jinja_env.bytecode_cache = make_bytecode_cache(
+            dict(TEMPLATE_CACHE_DIR=directory))
+        # templates already loaded would skip the bytecode cache
+        app.jinja_env.cache.clear()
+        try:
+            names = precompile_templates(app)
+            self.assertIn('tasks.html', names)
+            self.assertGreaterEqual(len(os.listdir(directory)), len(names))
+        finally:
+            app.jinja_env.bytecode_cache = bytecode_cache
+            app.jinja_env.cache.clear()
+            shutil.rmtree(directory)
+
+    def test_create_app_returns_the_app(self):
+        """Calling the factory again hands back the finished app."""
+        self.assertIs(create_app(), app)
+        self.assertIn('tasks', app.blueprints)
+
     # def test_500_error(self):
     #     bad_user = User(
     #         name='josh',
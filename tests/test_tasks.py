@@ -1,15 +1,50 @@
 """FlaskTaskr User Tests."""
 
+import json
 import os
+import time
 import unittest
 
-from project import app, db, bcrypt
+from sqlalchemy import event
+
+from project import create_app, cache, db, bcrypt, events
+from project.events import ChangeLogBroker
 from project._config import basedir
-from project.models import User
+from project.models import TaskChange, User
 
+app = create_app()
 TEST_DB = 'test.db'
 
 
+class QueryCounter(object):
+    """Count the SQL statements sent to the database inside a block."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self.callback)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(db.engine, 'before_cursor_execute', self.callback)
+
+    def callback(self, conn, cursor, statement, parameters, *args):
+        self.count += 1
+        self.statements.append((statement, parameters))
+
+    def query_plans(self):
+        """EXPLAIN QUERY PLAN output for every recorded statement."""
+        plans = []
+        for statement, parameters in self.statements:
+            rows = db.engine.execute(
+                'EXPLAIN QUERY PLAN ' + statement, parameters
+            ).fetchall()
+            plans.append(' | '.join(row['detail'] for row in rows))
+        return plans
+
+
 class TestCase(unittest.TestCase):
     """Test Class."""
 
@@ -24,6 +59,7 @@ class TestCase(unittest.TestCase):
             os.path.join(basedir, TEST_DB)
         self.app = app.test_client()
         db.create_all()
+        cache.clear()
 
         # Make sure we are testing in production mode
 
@@ -118,6 +154,41 @@ class TestCase(unittest.TestCase):
         response = self.create_task()
         self.assertIn(b'was successfully posted. Thanks.', response.data)
 
+    def test_adding_a_task_redirects_to_dashboard(self):
+        """Adding a task redirects rather than rendering the dashboard."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        response = self.app.post('add/', data=dict(
+            name='Goto the bank',
+            due_date='02/05/2014',
+            priority='1'
+        ))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.location.endswith('/tasks/'))
+
+    def test_users_can_add_tasks_as_json(self):
+        """Adding a task with Accept: application/json returns the row."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        response = self.app.post(
+            'add/',
+            data=dict(name='Goto the bank', due_date='02/05/2014',
+                      priority='1'),
+            headers={'Accept': 'application/json'}
+        )
+        self.assertEqual(response.status_code, 201)
+        task = json.loads(response.data.decode())['task']
+        self.assertEqual(task['task_id'], 1)
+        self.assertEqual(task['posted by'], 'tonyhat')
+
+        response = self.app.post(
+            'add/',
+            data=dict(name='Goto the bank', due_date='', priority='1'),
+            headers={'Accept': 'application/json'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'due_date', response.data)
+
     def test_users_cannot_add_tasks_when_error(self):
         """Adding tasks with blank field errors."""
         self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
@@ -252,5 +323,265 @@ class TestCase(unittest.TestCase):
         self.assertIn(b'/complete/2/', response.data)
         self.assertIn(b'/delete/2/', response.data)
 
+    def test_open_tasks_are_paginated(self):
+        """Open tasks are shown one page at a time."""
+        self.addCleanup(
+            app.config.__setitem__,
+            'OPEN_TASKS_PER_PAGE',
+            app.config['OPEN_TASKS_PER_PAGE']
+        )
+        app.config['OPEN_TASKS_PER_PAGE'] = 2
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        for _ in range(3):
+            self.create_task()
+        response = self.app.get('tasks/')
+        self.assertIn(b'/complete/1/', response.data)
+        self.assertIn(b'/complete/2/', response.data)
+        self.assertNotIn(b'/complete/3/', response.data)
+        self.assertIn(b'open_after=2014-02-05.2', response.data)
+        self.assertNotIn(b'Previous', response.data)
+
+        response = self.app.get('tasks/?open_after=2014-02-05.2')
+        self.assertNotIn(b'/complete/1/', response.data)
+        self.assertIn(b'/complete/3/', response.data)
+        self.assertIn(b'open_before=2014-02-05.3', response.data)
+        self.assertNotIn(b'Next', response.data)
+
+        response = self.app.get('tasks/?open_before=2014-02-05.3')
+        self.assertIn(b'/complete/1/', response.data)
+        self.assertIn(b'/complete/2/', response.data)
+        self.assertNotIn(b'/complete/3/', response.data)
+
+    def test_task_lists_page_independently(self):
+        """Paging one task list keeps the other list's cursor."""
+        self.addCleanup(
+            app.config.__setitem__,
+            'OPEN_TASKS_PER_PAGE',
+            app.config['OPEN_TASKS_PER_PAGE']
+        )
+        app.config['OPEN_TASKS_PER_PAGE'] = 1
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.create_task()
+        response = self.app.get('tasks/?closed_after=2014-02-05.7')
+        self.assertIn(b'/complete/1/', response.data)
+        self.assertIn(b'closed_after=2014-02-05.7', response.data)
+        self.assertIn(b'open_after=2014-02-05.1', response.data)
+
+    def test_dashboard_query_count_does_not_grow_with_tasks(self):
+        """Rendering the dashboard takes a fixed number of queries."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.register("joshua", "josh@ua.com", "joshua", "joshua")
+        self.login('joshua', 'joshua')
+        self.create_task()
+        self.app.get('complete/1/')
+        self.logout()
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        with QueryCounter() as few:
+            self.app.get('tasks/')
+        for _ in range(5):
+            self.create_task()
+        self.app.get('complete/3/')
+        with QueryCounter() as many:
+            response = self.app.get('tasks/')
+        self.assertIn(b'joshua', response.data)
+        # one per task list plus one for the counters
+        self.assertEqual(few.count, 3)
+        self.assertEqual(many.count, 3)
+
+    def test_dashboard_queries_use_indexes(self):
+        """Dashboard lists are served from an index without sorting."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        with QueryCounter() as queries:
+            self.app.get('tasks/')
+            self.app.get('tasks/?open_after=2014-02-05.1')
+            self.app.get('tasks/?closed_before=2014-02-05.1')
+        task_plans = [plan for plan in queries.query_plans()
+                      if 'task_stats' not in plan]
+        self.assertTrue(task_plans)
+        for plan in task_plans:
+            self.assertIn('ix_tasks_status_due_date', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_complete_and_delete_take_few_queries(self):
+        """Completing is two reads (the task, then which of it is still
+        open), a write and two bookkeeping writes (the counters and the
+        change log); deleting takes a read and four writes, as open and
+        closed tasks are deleted separately."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.create_task()
+        with QueryCounter() as complete:
+            self.app.get('complete/1/')
+        with QueryCounter() as delete:
+            self.app.get('delete/2/')
+        self.assertEqual(complete.count, 5)
+        self.assertEqual(delete.count, 5)
+
+    def test_dashboard_shows_task_counts(self):
+        """The dashboard header shows the maintained task counters."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.register("joshua", "josh@ua.com", "joshua", "joshua")
+        self.login('joshua', 'joshua')
+        self.create_task()
+        self.create_task()
+        self.app.get('complete/1/')
+        self.logout()
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        response = self.app.get('tasks/')
+        self.assertIn(b'2 open and 1 closed tasks', response.data)
+        self.assertIn(b'1 open and 0 closed\n    are yours', response.data)
+        self.app.get('delete/3/')
+        response = self.app.get('tasks/')
+        self.assertIn(b'1 open and 1 closed tasks', response.data)
+
+    def test_dashboard_search(self):
+        """The dashboard search finds tasks by name prefix."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.app.get('complete/1/')
+        response = self.app.get('tasks/search/?q=ban')
+        self.assertIn(b'Goto the bank', response.data)
+        self.assertIn(b'Closed', response.data)
+        response = self.app.get('tasks/search/?q=nothing')
+        self.assertIn(b'No matching tasks.', response.data)
+
+    def open_stream(self):
+        """Open /tasks/stream as a threaded server would."""
+        return self.app.get(
+            'tasks/stream',
+            environ_overrides={'wsgi.multithread': True},
+            buffered=False
+        )
+
+    def test_stream_pushes_task_changes(self):
+        """Open streams get created, completed and deleted events."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        response = self.open_stream()
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        self.assertIn(b'retry:', next(chunks))
+        self.create_task()
+        self.app.get('complete/1/')
+        self.app.get('delete/1/')
+        created = next(chunks)
+        self.assertIn(b'event: created', created)
+        self.assertIn(b'"posted_by":"tonyhat"', created)
+        self.assertIn(b'event: completed', next(chunks))
+        self.assertIn(b'event: deleted', next(chunks))
+        response.close()
+        self.assertEqual(events.subscribers, 0)
+
+    def test_stream_is_refused_where_it_would_pin_a_worker(self):
+        """Sync workers get a 204 and a full process gets a 503."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        response = self.app.get('tasks/stream')
+        self.assertEqual(response.status_code, 204)
+        limit = events.max_subscribers
+        events.max_subscribers = 0
+        try:
+            response = self.open_stream()
+        finally:
+            events.max_subscribers = limit
+        self.assertEqual(response.status_code, 503)
+
+    def test_change_log_broker_sees_every_write(self):
+        """The change log broker picks up changes from the database."""
+        broker = ChangeLogBroker(db, poll_interval=0.05)
+        subscription = broker.subscribe()
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.app.get('complete/1/')
+        created = subscription.get(timeout=5)
+        self.assertEqual(created['type'], 'created')
+        self.assertEqual(created['task']['name'], 'Goto the bank')
+        self.assertEqual(created['task']['posted_by'], 'tonyhat')
+        self.assertEqual(subscription.get(timeout=5)['type'], 'completed')
+        subscription.close()
+
+    def test_change_log_broker_survives_database_errors(self):
+        """The poller keeps going when the change log can't be read."""
+        TaskChange.__table__.drop(db.engine)
+        broker = ChangeLogBroker(db, poll_interval=0.05)
+        subscription = broker.subscribe()
+        time.sleep(0.2)
+        TaskChange.__table__.create(db.engine)
+        time.sleep(0.2)
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.assertEqual(subscription.get(timeout=5)['type'], 'created')
+        subscription.close()
+
+    def test_missing_tasks_return_404(self):
+        """Completing or deleting a missing task is a 404."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        response = self.app.get('complete/42/')
+        self.assertEqual(response.status_code, 404)
+        response = self.app.get('delete/42/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_dashboard_is_served_from_cache_until_tasks_change(self):
+        """Repeat dashboard hits skip the database until a task changes."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        self.app.get('tasks/')
+        with QueryCounter() as queries:
+            response = self.app.get('tasks/')
+        self.assertEqual(queries.count, 0)
+        self.assertIn(b'/complete/1/', response.data)
+
+        self.app.get('complete/1/')
+        response = self.app.get('tasks/')
+        self.assertNotIn(b'/complete/1/', response.data)
+
+    def test_cached_rows_depend_on_the_viewer(self):
+        """Rows cached for the task's owner don't leak its links."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        response = self.app.get('tasks/')
+        self.assertIn(b'/complete/1/', response.data)
+        self.logout()
+        self.register("joshua", "josh@ua.com", "joshua", "joshua")
+        self.login('joshua', 'joshua')
+        response = self.app.get('tasks/')
+        self.assertIn(b'Goto the bank', response.data)
+        self.assertNotIn(b'/complete/1/', response.data)
+        self.assertIn(b'N/A', response.data)
+
+    def test_dashboard_answers_if_none_match_with_304(self):
+        """An unchanged dashboard revalidates with a 304."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        etag = self.app.get('tasks/').headers['ETag']
+        response = self.app.get('tasks/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.create_task()
+        response = self.app.get('tasks/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """A malformed cursor falls back to the first page."""
+        self.register("tonyhat", "tony@hat.com", "tonyhat", "tonyhat")
+        self.login('tonyhat', 'tonyhat')
+        self.create_task()
+        response = self.app.get('tasks/?open_after=not-a-cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/complete/1/', response.data)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,15 +1,38 @@
 """FlaskTaskr User Tests."""
 
 import os
+import threading
+import time
 import unittest
 
-from project import app, db, bcrypt
+from werkzeug.contrib.fixers import ProxyFix
+
+from project import create_app, db, bcrypt, hasher, login_throttle
+from project.hashing import HasherBusy, PasswordHasher, hash_cost
 from project._config import basedir
 from project.models import User
 
+app = create_app()
 TEST_DB = 'test.db'
 
 
+class SlowBcrypt(object):
+    """Stands in for bcrypt, counting what it is asked to do."""
+
+    def __init__(self):
+        self.generated = 0
+        self.checked = 0
+
+    def generate_password_hash(self, password, rounds):
+        self.generated += 1
+        time.sleep(0.05)
+        return '$2b${0:02d}$fake'.format(rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        self.checked += 1
+        return False
+
+
 class TestCase(unittest.TestCase):
     """Test Class."""
 
@@ -24,6 +47,7 @@ class TestCase(unittest.TestCase):
             os.path.join(basedir, TEST_DB)
         self.app = app.test_client()
         db.create_all()
+        login_throttle.reset()
 
         # Make sure we are testing in production mode
 
@@ -169,5 +193,120 @@ class TestCase(unittest.TestCase):
         for user in users:
             self.assertEqual(user.role, "user")
 
+    def test_password_rehashed_on_login_when_cost_changes(self):
+        """Logging in rehashes a password stored with another cost."""
+        db.session.add(User(
+            name='Michael',
+            email='michael@realpython.com',
+            password=bcrypt.generate_password_hash('python', 4)
+        ))
+        db.session.commit()
+        response = self.login('Michael', 'python')
+        self.assertIn(b'Welcome', response.data)
+        user = User.query.filter_by(name='Michael').first()
+        self.assertEqual(
+            hash_cost(user.password), app.config['BCRYPT_LOG_ROUNDS'])
+        self.logout()
+        response = self.login('Michael', 'python')
+        self.assertIn(b'Welcome', response.data)
+
+    def test_login_returns_503_when_hasher_is_full(self):
+        """Logins get a 503 when every hashing slot is taken."""
+        self.create_user('Michael', 'michael@realpython.com', 'python')
+        workers, max_waiting = hasher.workers, hasher.max_waiting
+        hasher.workers, hasher.max_waiting = 0, 0
+        try:
+            response = self.app.post(
+                '/', data=dict(name='Michael', password='python'))
+        finally:
+            hasher.workers, hasher.max_waiting = workers, max_waiting
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertIn(b'Please try again in a moment', response.data)
+
+    def test_failed_logins_are_throttled_per_username(self):
+        """Failed logins against one username are throttled."""
+        self.create_user('Michael', 'michael@realpython.com', 'python')
+        for _ in range(login_throttle.user_limit):
+            self.login('Michael', 'wrong')
+        response = self.app.post(
+            '/', data=dict(name='Michael', password='python'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(login_throttle.rejected, 1)
+        # another username from the same address is still let through
+        response = self.login('Someone', 'python')
+        self.assertIn(b'Invalid credentials', response.data)
+
+    def test_throttled_login_skips_database_and_bcrypt(self):
+        """A throttled login never reaches the database or bcrypt."""
+        for _ in range(login_throttle.user_limit):
+            self.login('Michael', 'wrong')
+        checks = hasher.dummy_checks
+        response = self.app.post(
+            '/', data=dict(name='michael', password='python'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(hasher.dummy_checks, checks)
+
+    def test_unknown_users_are_checked_against_a_dummy_hash(self):
+        """Unknown usernames still cost a bcrypt check."""
+        checks = hasher.dummy_checks
+        self.login('nobody', 'python')
+        self.assertEqual(hasher.dummy_checks, checks + 1)
+
+    def test_dummy_hash_is_made_once_inside_a_slot(self):
+        """The dummy hash waits for a slot and is only made once."""
+        slow_bcrypt = SlowBcrypt()
+        config = {'BCRYPT_LOG_ROUNDS': 4}
+        busy = PasswordHasher(slow_bcrypt, config, workers=0, max_waiting=0)
+        self.assertRaises(HasherBusy, busy.check_user, None, 'python')
+        self.assertEqual(slow_bcrypt.generated, 0)
+
+        idle = PasswordHasher(slow_bcrypt, config, workers=4)
+        threads = [
+            threading.Thread(target=idle.check_user, args=(None, 'python'))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(slow_bcrypt.generated, 1)
+        self.assertEqual(slow_bcrypt.checked, 3)
+
+    def test_throttle_uses_forwarded_address_behind_a_proxy(self):
+        """Behind a trusted proxy, one client's failures don't block others."""
+        wsgi_app, ip_limit = app.wsgi_app, login_throttle.ip_limit
+        app.wsgi_app = ProxyFix(wsgi_app, num_proxies=1)
+        login_throttle.ip_limit = 3
+        try:
+            for i in range(3):
+                self.app.post(
+                    '/', data=dict(name='user{0}'.format(i), password='x'),
+                    headers={'X-Forwarded-For': '203.0.113.7'})
+            response = self.app.post(
+                '/', data=dict(name='other', password='x'),
+                headers={'X-Forwarded-For': '203.0.113.7'})
+            self.assertEqual(response.status_code, 429)
+            response = self.app.post(
+                '/', data=dict(name='other', password='x'),
+                headers={'X-Forwarded-For': '198.51.100.2'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            app.wsgi_app, login_throttle.ip_limit = wsgi_app, ip_limit
+
+    def test_login_stats_are_admin_only(self):
+        """Login stats are only shown to admins."""
+        response = self.app.get('/login-stats/', follow_redirects=True)
+        self.assertIn(b'You need to login first', response.data)
+        db.session.add(User('Michael', 'michael@realpython.com',
+                            bcrypt.generate_password_hash('python'),
+                            'admin'))
+        db.session.commit()
+        self.login('Michael', 'python')
+        response = self.app.get('/login-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'hashes_avoided', response.data)
+
 if __name__ == "__main__":
     unittest.main()
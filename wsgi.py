@@ -0,0 +1,15 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn_config.py wsgi:app
+
+Templates are compiled here, in gunicorn's master when it preloads the
+app, so forked workers start with them instead of each compiling its own.
+"""
+
+from project import create_app
+from project.templating import precompile_templates
+
+app = create_app()
+precompile_templates(app)
+
+application = app